@@ -0,0 +1,162 @@
+# Synthetic chat load for TwitchVoteBot: generated messages are fed straight into event_message
+# with channel.send stubbed out, so the vote/queue hot paths can be measured offline.
+# Journal and export files go to a temporary directory.
+#
+#   python bench_chat_load.py --users 50000 --messages 200000 --rate 0 --spam-ratio 0.3
+#   python bench_chat_load.py --rate 2000 --distribution zipf --json
+import argparse
+import array
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from chat_fakes import FakeAuthor, FakeChannel, FakeMessage, percentile
+from twitch_bot_core import TwitchVoteBot, KeywordMatcher
+
+CHATTER = ("lol", "PogChamp", "KEKW", "gg", "hello chat", "what is this vote about?",
+           "I think A is better but B has a point honestly", "LUL LUL LUL", "first time here", "!discord")
+
+def choice_weights(choices, distribution):
+    if distribution == "uniform":
+        return [1] * len(choices)
+    if distribution == "zipf":
+        return [1 / (idx + 1) for idx in range(len(choices))]
+    weights = [float(weight) for weight in distribution.split(",")]
+    if len(weights) != len(choices):
+        raise SystemExit("--distribution needs one weight per choice")
+    return weights
+
+def build_authors(count, sub_ratio, rng):
+    authors = []
+    for idx in range(count):
+        badges = ""
+        if rng.random() < sub_ratio:
+            badges = f"subscriber/{rng.choice((0, 3, 12, 2006, 3024))}"
+        authors.append((FakeAuthor(f"viewer_{idx:07d}", str(10_000_000 + idx)), badges))
+    return authors
+
+def generate_messages(args, channel, rng):
+    choices = [choice.strip().upper() for choice in args.choices.split(",") if choice.strip()]
+    weights = choice_weights(choices, args.distribution)
+    authors = build_authors(args.users, args.sub_ratio, rng)
+    for _ in range(args.messages):
+        author, badges = authors[rng.randrange(len(authors))]
+        roll = rng.random()
+        if roll < args.spam_ratio:
+            content = rng.choice(CHATTER)
+        elif roll < args.spam_ratio + args.queue_ratio:
+            content = args.queue_keyword.lower()
+        else:
+            content = rng.choices(choices, weights)[0]
+            content = content.lower() if rng.random() < 0.5 else f" {content} "
+        tags = {"badges": badges, "tmi-sent-ts": str(int(time.time() * 1000))}
+        yield FakeMessage(content, author, channel, tags)
+
+async def run(args):
+    rng = random.Random(args.seed)
+    channel = FakeChannel("benchchannel")
+    choices = [choice.strip().upper() for choice in args.choices.split(",") if choice.strip()]
+    bot = TwitchVoteBot("bench", channel.name, choices, [args.queue_keyword.upper()], 24 * 3600,
+                        None, None, None, None, None, per_channel_files=True)
+    state = bot.primary
+    state.channel = channel
+    state.match_mode = args.match_mode
+    if args.no_rate_limit:
+        bot.outbox.set_limits(1_000_000, 1)
+    bot.outbox.start()
+    state.begin_vote()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    latencies = array.array("d")
+    messages = generate_messages(args, channel, rng)
+    interval = 1 / args.rate if args.rate else 0
+    started = time.perf_counter()
+    for idx, message in enumerate(messages):
+        if interval:
+            delay = started + idx * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif idx % 1000 == 0:
+            await asyncio.sleep(0)  # Let the outbox run like it would between socket reads
+        before = time.perf_counter()
+        await bot.event_message(message)
+        latencies.append(time.perf_counter() - before)
+    elapsed = time.perf_counter() - started
+
+    finish_started = time.perf_counter()
+    state.scheduler.cancel()
+    await state.on_vote_close(stopped=True)
+    finish_time = time.perf_counter() - finish_started
+    await asyncio.sleep(args.drain)
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    bot.outbox.task.cancel()
+    state.journal.close()
+    outbox = bot.outbox.stats()
+    return {
+        "messages": len(latencies),
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_us": percentile(latencies, 0.50) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "max_us": max(latencies) * 1e6 if latencies else 0.0,
+        "finish_ms": finish_time * 1000,
+        "voters": len(state.votes),
+        "queue": len(state.queue_list),
+        "sent": channel.sent,
+        "sent_bytes": channel.sent_bytes,
+        "acks_merged": outbox["merged"],
+        "outbox_left": outbox["depth"],
+        "traced_peak_mib": traced_peak / 2**20 if traced_peak is not None else None,
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive TwitchVoteBot with synthetic chat")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--rate", type=float, default=0, help="messages per second, 0 for as fast as possible")
+    parser.add_argument("--choices", default="A,B,C,D")
+    parser.add_argument("--distribution", default="uniform", help="uniform, zipf or one weight per choice (50,30,15,5)")
+    parser.add_argument("--spam-ratio", type=float, default=0.3, help="share of messages that match nothing")
+    parser.add_argument("--queue-ratio", type=float, default=0.05, help="share of messages that are the queue keyword")
+    parser.add_argument("--queue-keyword", default="JOIN")
+    parser.add_argument("--sub-ratio", type=float, default=0.1)
+    parser.add_argument("--match-mode", default=KeywordMatcher.EXACT, choices=KeywordMatcher.MODES)
+    parser.add_argument("--no-rate-limit", action="store_true", help="let the outbox send without Twitch's limits")
+    parser.add_argument("--drain", type=float, default=0.5, help="seconds to let the outbox run after the vote")
+    parser.add_argument("--trace-memory", action="store_true", help="report the tracemalloc peak (slows the run)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the result as one JSON object")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_chat_")
+    os.chdir(workdir)
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(f"{result['messages']} messages from {args.users} users in {result['seconds']:.2f} s ({workdir})")
+    print(f"throughput   {result['throughput']:>12.0f} msg/s")
+    print(f"latency      p50 {result['p50_us']:.1f} us  p99 {result['p99_us']:.1f} us  max {result['max_us']:.0f} us")
+    print(f"finish_vote  {result['finish_ms']:>12.1f} ms for {result['voters']} voters, {result['queue']} in queue")
+    print(f"sent         {result['sent']:>12} messages, {result['sent_bytes']} bytes, {result['acks_merged']} acks merged, {result['outbox_left']} left")
+    if result["traced_peak_mib"] is not None:
+        print(f"traced peak  {result['traced_peak_mib']:>12.1f} MiB")
+    if result["max_rss_mib"] is not None:
+        print(f"max RSS      {result['max_rss_mib']:>12.1f} MiB")
+
+if __name__ == "__main__":
+    main()
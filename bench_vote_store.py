@@ -0,0 +1,78 @@
+# Memory benchmark for vote storage: the old per-user set/dict/Helix-dict layout against
+# VoteStore + SubscriptionRecord. User names are created before measuring because both
+# layouts share them with the incoming chat messages.
+#
+#   python bench_vote_store.py --users 1000000 --choices 4 --sub-ratio 0.1
+import argparse
+import gc
+import random
+import tracemalloc
+
+from twitch_bot_core import VoteStore, SubscriptionRecord
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+def build_legacy(voters, choices, tiers):
+    voted_users = set()
+    votes = {}
+    subscriptions = {}
+    for user, choice, tier in zip(voters, choices, tiers):
+        voted_users.add(user)
+        votes[user] = choice
+        if tier != "0000":
+            subscriptions[user] = {
+                "broadcaster_id": "123456789",
+                "broadcaster_login": "channel",
+                "broadcaster_name": "Channel",
+                "gifter_id": "",
+                "gifter_login": "",
+                "gifter_name": "",
+                "is_gift": False,
+                "plan_name": "Channel Subscription",
+                "tier": tier,
+                "user_id": str(hash(user) & 0xFFFFFFFF),
+                "user_name": user,
+                "user_login": user
+            }
+    return voted_users, votes, subscriptions
+
+def build_compact(voters, choices, tiers):
+    store = VoteStore(sorted(set(choices)))
+    subscriptions = {}
+    for user, choice, tier in zip(voters, choices, tiers):
+        store.add(user, choice, tier)
+        if tier != "0000":
+            subscriptions[user] = SubscriptionRecord(tier)
+    return store, subscriptions
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vote storage memory usage")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--choices", type=int, default=4)
+    parser.add_argument("--sub-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    options = [chr(ord("A") + idx) if idx < 26 else str(idx) for idx in range(args.choices)]
+    voters = [f"viewer_{idx:07d}" for idx in range(args.users)]
+    choices = [rng.choice(options) for _ in voters]
+    tiers = [rng.choice(("1000", "1000", "1000", "2000", "3000")) if rng.random() < args.sub_ratio else "0000" for _ in voters]
+
+    print(f"{args.users} voters, {args.choices} choices, {args.sub_ratio:.0%} subscribers")
+    legacy_current, legacy_peak = measure(lambda: build_legacy(voters, choices, tiers))
+    compact_current, compact_peak = measure(lambda: build_compact(voters, choices, tiers))
+    print(f"{'layout':<10}{'retained MiB':>14}{'peak MiB':>12}{'bytes/voter':>14}")
+    for name, current, peak in (("legacy", legacy_current, legacy_peak), ("compact", compact_current, compact_peak)):
+        print(f"{name:<10}{current / 2**20:>14.1f}{peak / 2**20:>12.1f}{current / args.users:>14.1f}")
+    print(f"compact uses {compact_current / legacy_current:.1%} of legacy")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+# Record real chat traffic and replay it into TwitchVoteBot.
+#
+# A capture is a series of zlib-compressed blocks, each holding up to block_size messages as
+# (seconds since capture start, raw IRC line). Every block starts with a small header, and an
+# index of (offset, first time, count) is written at the end, so a replay can jump straight
+# to a time offset. A capture cut short by a crash has no index; it is rebuilt by walking the
+# block headers.
+#
+#   python Twitch_Bot.py --headless --channels a --record stream.twcap
+#   python chat_capture.py info stream.twcap
+#   python chat_capture.py replay stream.twcap --speed 10 --start 600 --choices A,B
+import argparse
+import asyncio
+import bisect
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from chat_fakes import FakeAuthor, FakeChannel, FakeMessage, percentile
+from twitch_bot_core import TwitchVoteBot
+
+MAGIC = b"TWCAP1\n"
+FOOTER_MAGIC = b"TWIDX1\n"
+BLOCK_HEADER = struct.Struct("<IId")  # compressed length, message count, first time
+RECORD_HEADER = struct.Struct("<dI")  # time, line length
+INDEX_ENTRY = struct.Struct("<QdI")  # block offset, first time, message count
+FOOTER = struct.Struct("<QI")  # index offset, index entries
+
+TAG_ESCAPES = {"\\": "\\\\", ";": "\\:", " ": "\\s", "\r": "\\r", "\n": "\\n"}
+TAG_UNESCAPES = {"\\": "\\", ":": ";", "s": " ", "r": "\r", "n": "\n"}
+
+def escape_tag(value):
+    return "".join(TAG_ESCAPES.get(char, char) for char in value)
+
+def unescape_tag(value):
+    if "\\" not in value:
+        return value
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            char = TAG_UNESCAPES.get(next(chars, ""), "")
+        result.append(char)
+    return "".join(result)
+
+def to_irc_line(message):
+    # twitchio keeps the line it parsed; messages built some other way are serialized here
+    raw = getattr(message, "raw_data", None)
+    if raw:
+        return raw
+    tags = ";".join(f"{key}={escape_tag(str(value))}" for key, value in (message.tags or {}).items())
+    name = message.author.name
+    line = f":{name}!{name}@{name}.tmi.twitch.tv PRIVMSG #{message.channel.name} :{message.content}"
+    return f"@{tags} {line}" if tags else line
+
+def parse_irc_line(line):
+    # Returns (tags, login, channel, content) for a PRIVMSG line
+    tags = {}
+    if line.startswith("@"):
+        raw_tags, line = line[1:].split(" ", 1)
+        for item in raw_tags.split(";"):
+            key, _, value = item.partition("=")
+            tags[key] = unescape_tag(value)
+    prefix, command, rest = line.split(" ", 2)
+    if command != "PRIVMSG":
+        raise ValueError(f"not a chat message: {command}")
+    login = prefix.lstrip(":").split("!", 1)[0]
+    channel, _, content = rest.partition(" :")
+    return tags, login, channel.lstrip("#"), content
+
+class ChatRecorder:
+    # Attach as bot.recorder; event_message calls record() for every incoming message. Blocks
+    # are compressed and written by a background thread so the loop only appends to a list.
+    def __init__(self, path, block_size=1000, block_seconds=5.0):
+        self.path = path
+        self.block_size = block_size
+        self.block_seconds = block_seconds
+        self.started = time.time()
+        self.pending = []
+        self.pending_since = None
+        self.index = []
+        self.blocks = queue.Queue()
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record(self, message):
+        now = time.time()
+        self.pending.append((now - self.started, to_irc_line(message)))
+        if self.pending_since is None:
+            self.pending_since = now
+        if len(self.pending) >= self.block_size or now - self.pending_since >= self.block_seconds:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.blocks.put(self.pending)
+            self.pending = []
+            self.pending_since = None
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.flush()
+        self.blocks.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                break
+            payload = bytearray()
+            for offset, line in block:
+                data = line.encode("utf-8")
+                payload += RECORD_HEADER.pack(offset, len(data))
+                payload += data
+            compressed = zlib.compress(bytes(payload), 6)
+            self.index.append((self.file.tell(), block[0][0], len(block)))
+            self.file.write(BLOCK_HEADER.pack(len(compressed), len(block), block[0][0]))
+            self.file.write(compressed)
+            self.file.flush()
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index)))
+        self.file.write(FOOTER_MAGIC)
+        self.file.close()
+
+class ChatCapture:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a chat capture")
+        self.index = self.read_index() or self.scan_index()
+        self.times = [first for _, first, _ in self.index]
+
+    def __len__(self):
+        return sum(count for _, _, count in self.index)
+
+    def read_index(self):
+        size = self.file.seek(0, os.SEEK_END)
+        tail = FOOTER.size + len(FOOTER_MAGIC)
+        if size < len(MAGIC) + tail:
+            return None
+        self.file.seek(size - tail)
+        footer = self.file.read(tail)
+        if footer[FOOTER.size:] != FOOTER_MAGIC:
+            return None
+        index_offset, entries = FOOTER.unpack(footer[:FOOTER.size])
+        self.file.seek(index_offset)
+        data = self.file.read(entries * INDEX_ENTRY.size)
+        return [INDEX_ENTRY.unpack_from(data, idx * INDEX_ENTRY.size) for idx in range(entries)]
+
+    def scan_index(self):
+        index = []
+        offset = len(MAGIC)
+        while True:
+            self.file.seek(offset)
+            header = self.file.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                break
+            length, count, first = BLOCK_HEADER.unpack(header)
+            if len(self.file.read(length)) < length:
+                break  # Torn last block
+            index.append((offset, first, count))
+            offset += BLOCK_HEADER.size + length
+        return index
+
+    @property
+    def duration(self):
+        if not self.index:
+            return 0.0
+        return list(self.read_block(len(self.index) - 1))[-1][0]
+
+    def read_block(self, idx):
+        offset, _, _ = self.index[idx]
+        self.file.seek(offset)
+        length, count, _ = BLOCK_HEADER.unpack(self.file.read(BLOCK_HEADER.size))
+        payload = zlib.decompress(self.file.read(length))
+        position = 0
+        for _ in range(count):
+            offset, size = RECORD_HEADER.unpack_from(payload, position)
+            position += RECORD_HEADER.size
+            yield offset, payload[position:position + size].decode("utf-8")
+            position += size
+
+    def iter_records(self, start=0.0, end=None):
+        # Only the block holding start and the ones after it are read
+        first = max(0, bisect.bisect_right(self.times, start) - 1)
+        for idx in range(first, len(self.index)):
+            for offset, line in self.read_block(idx):
+                if offset < start:
+                    continue
+                if end is not None and offset > end:
+                    return
+                yield offset, line
+
+    def close(self):
+        self.file.close()
+
+async def replay(bot, capture, speed=1.0, start=0.0, end=None, on_message=None):
+    # speed 0 replays as fast as possible. tmi-sent-ts is rewritten to the replay clock so the
+    # vote window judges messages the way it did live; the original stays in replay-sent-ts.
+    channels = {}
+    authors = {}
+    latencies = []
+    loop = asyncio.get_running_loop()
+    replay_started = loop.time()
+    for idx, (offset, line) in enumerate(capture.iter_records(start, end)):
+        if speed:
+            delay = replay_started + (offset - start) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif idx % 1000 == 0:
+            await asyncio.sleep(0)
+        try:
+            tags, login, channel_name, content = parse_irc_line(line)
+        except ValueError:
+            continue
+        channel = channels.get(channel_name)
+        if channel is None:
+            channel = channels[channel_name] = FakeChannel(channel_name)
+            state = bot.channels.get(channel_name)
+            if state is not None and state.channel is None:
+                state.channel = channel
+        author = authors.get(login)
+        if author is None:
+            author = authors[login] = FakeAuthor(login, tags.get("user-id", ""))
+        author.is_mod = tags.get("mod") == "1"
+        author.is_broadcaster = "broadcaster/" in tags.get("badges", "")
+        if "tmi-sent-ts" in tags:
+            tags["replay-sent-ts"] = tags["tmi-sent-ts"]
+        tags["tmi-sent-ts"] = str(int(time.time() * 1000))
+        before = time.perf_counter()
+        await bot.event_message(FakeMessage(content, author, channel, tags))
+        latencies.append(time.perf_counter() - before)
+        if on_message:
+            on_message(offset, line)
+    return latencies, channels
+
+def print_info(path):
+    capture = ChatCapture(path)
+    print(f"{path}: {len(capture)} messages in {len(capture.index)} blocks, {capture.duration:.1f} s, {os.path.getsize(path) / 2**20:.2f} MiB")
+    channels = {}
+    for _, line in capture.iter_records():
+        try:
+            channel = parse_irc_line(line)[2]
+        except ValueError:
+            continue
+        channels[channel] = channels.get(channel, 0) + 1
+    for channel, count in sorted(channels.items(), key=lambda item: item[1], reverse=True):
+        print(f"  #{channel}: {count}")
+    capture.close()
+
+async def run_replay(args):
+    capture = ChatCapture(args.capture)
+    channels = sorted({parse_irc_line(line)[2] for _, line in capture.iter_records(args.start, args.end) if " PRIVMSG " in line})
+    if not channels:
+        raise SystemExit("Nothing to replay in that range")
+    choices = [choice.strip().upper() for choice in args.choices.split(",") if choice.strip()]
+    keywords = [keyword.strip().upper() for keyword in args.queue_keywords.split(",") if keyword.strip()]
+    duration = args.vote_duration / args.speed if args.speed else args.vote_duration
+    bot = TwitchVoteBot("replay", channels, choices, keywords, max(1, int(duration)),
+                        None, None, None, None, None, per_channel_files=True, chat_control=True)
+    bot.outbox.set_limits(1_000_000, 1)
+    bot.outbox.start()
+    if choices:
+        for state in bot.channels.values():
+            state.begin_vote()
+    if args.profile:
+        bot.profiler.start(0)
+
+    started = time.perf_counter()
+    latencies, fake_channels = await replay(bot, capture, args.speed, args.start, args.end)
+    elapsed = time.perf_counter() - started
+    for state in bot.channels.values():
+        if state.vote_running:
+            state.stop_vote_now()
+    await asyncio.sleep(0.5)
+    bot.profiler.stop()
+    await asyncio.sleep(0.5)
+    bot.outbox.task.cancel()
+    for state in bot.channels.values():
+        state.journal.close()
+    capture.close()
+
+    print(f"replayed {len(latencies)} messages from {len(channels)} channels in {elapsed:.2f} s ({len(latencies) / elapsed:.0f} msg/s)")
+    print(f"latency p50 {percentile(latencies, 0.5) * 1e6:.1f} us  p99 {percentile(latencies, 0.99) * 1e6:.1f} us")
+    for row in bot.stats():
+        sent = fake_channels[row["channel"]].sent if row["channel"] in fake_channels else 0
+        print(f"  #{row['channel']}: {row['messages']} messages, {row['routed']} routed, {row['votes']} voters, {row['queue']} in queue, {sent} sent")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay a chat capture")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info = subparsers.add_parser("info", help="show what a capture holds")
+    info.add_argument("capture")
+    play = subparsers.add_parser("replay", help="feed a capture into a TwitchVoteBot")
+    play.add_argument("capture")
+    play.add_argument("--speed", type=float, default=1.0, help="1 for real time, N for N times faster, 0 for as fast as possible")
+    play.add_argument("--start", type=float, default=0.0, help="seconds into the capture to start from")
+    play.add_argument("--end", type=float, default=None, help="seconds into the capture to stop at")
+    play.add_argument("--choices", default="", help="start a vote with these choices when the replay starts")
+    play.add_argument("--vote-duration", type=float, default=60, help="vote length in capture seconds")
+    play.add_argument("--queue-keywords", default="")
+    play.add_argument("--profile", action="store_true", help="profile the replay, reports go to profiles/")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        print_info(args.capture)
+        return
+    args.capture = os.path.abspath(args.capture)
+    workdir = tempfile.mkdtemp(prefix="replay_")
+    os.chdir(workdir)  # Journals and exports of the replayed votes
+    print(f"working in {workdir}")
+    asyncio.run(run_replay(args))
+
+if __name__ == "__main__":
+    main()
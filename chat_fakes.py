@@ -0,0 +1,35 @@
+# Stand-ins for the twitchio objects TwitchVoteBot reads, for driving the bot without a
+# connection: bench_chat_load.py generates traffic with them and chat_capture.py replays
+# recorded traffic through them.
+
+class FakeChannel:
+    def __init__(self, name):
+        self.name = name
+        self.sent = 0
+        self.sent_bytes = 0
+
+    async def send(self, text):
+        self.sent += 1
+        self.sent_bytes += len(text.encode("utf-8"))
+
+class FakeAuthor:
+    def __init__(self, name, user_id, is_mod=False, is_broadcaster=False):
+        self.name = name
+        self.id = user_id
+        self.is_mod = is_mod
+        self.is_broadcaster = is_broadcaster
+
+class FakeMessage:
+    # The attributes of twitchio's Message that the bot reads
+    def __init__(self, content, author, channel, tags, echo=False):
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.tags = tags
+        self.echo = echo
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,2592 @@
+from twitchio.ext import commands
+import asyncio
+import threading
+import aiohttp
+import requests
+import time
+import random
+import json
+import os
+import string
+import collections
+import itertools
+import bisect
+import queue
+import atexit
+import csv
+import gzip
+import cProfile
+import pstats
+import tracemalloc
+import array
+import sys
+import math
+import multiprocessing
+import socket
+
+PUNCTUATION = string.punctuation + "“”‘’…"
+
+def generate_random_string(length):
+    pool = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    return ''.join(random.choices(pool, k=length))
+
+def get_tier_from_tags(tags):
+    # The subscriber badge version is the months count, offset by 2000/3000 for tier 2/3 subs
+    if not tags or ("badges" not in tags and "subscriber" not in tags):
+        return None
+    badges = {}
+    for badge in (tags.get("badges") or "").split(","):
+        name, _, version = badge.partition("/")
+        if name:
+            badges[name] = version
+    version = badges.get("subscriber")
+    if version is not None:
+        months = int(version) if version.isdigit() else 0
+        if months >= 3000:
+            return "3000"
+        if months >= 2000:
+            return "2000"
+        return "1000"
+    if "founder" in badges or tags.get("subscriber") == "1":
+        return "1000"
+    return "0000"
+
+# Seconds; fine enough at the low end for per-message handling, wide enough for Helix calls
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Histogram:
+    # Fixed buckets, so observing is a bisect and two additions
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q, counts=None):
+        # Upper bound of the bucket holding the q-th observation; counts may be a window diff
+        counts = self.counts if counts is None else counts
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for idx, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[idx] if idx < len(self.bounds) else math.inf
+        return math.inf
+
+class MetricsRegistry:
+    # Counters and histograms are updated in place on the hot path; gauges and counters that
+    # mirror existing fields are read through a callback only when somebody looks. Exposed in
+    # the Prometheus text format on a local port and as a periodic one-line summary.
+    def __init__(self):
+        self.families = {}
+        self.tasks = []
+        self.server = None
+
+    def get(self, kind, name, help_text, labels, factory):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = {"kind": kind, "help": help_text, "series": {}}
+        key = tuple(sorted(labels.items()))
+        series = family["series"].get(key)
+        if series is None or callable(series):
+            series = family["series"][key] = factory()
+        return series
+
+    def counter(self, name, help_text, **labels):
+        return self.get("counter", name, help_text, labels, Counter)
+
+    def histogram(self, name, help_text, bounds=LATENCY_BUCKETS, **labels):
+        return self.get("histogram", name, help_text, labels, lambda: Histogram(bounds))
+
+    def read(self, kind, name, help_text, read, **labels):
+        # kind is "gauge" or "counter"; read() returns the current value
+        self.get(kind, name, help_text, labels, lambda: read)
+
+    def total(self, name):
+        family = self.families.get(name)
+        if family is None:
+            return 0
+        return sum(series() if callable(series) else series.value for series in family["series"].values())
+
+    def merged(self, name):
+        # Series of one family share its bounds, so the merged histogram takes them from any
+        family = self.families.get(name)
+        series_list = list(family["series"].values()) if family else []
+        merged = Histogram(series_list[0].bounds) if series_list else Histogram()
+        for series in series_list:
+            merged.counts = [a + b for a, b in zip(merged.counts, series.counts)]
+            merged.sum += series.sum
+            merged.count += series.count
+        return merged
+
+    def render(self):
+        lines = []
+        for name, family in self.families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            for key, series in list(family["series"].items()):
+                labels = ",".join(f'{label}="{value}"' for label, value in key)
+                if family["kind"] != "histogram":
+                    value = series() if callable(series) else series.value
+                    lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+                    continue
+                prefix = labels + "," if labels else ""
+                cumulative = 0
+                for bound, count in zip(series.bounds + ("+Inf",), series.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {series.sum}")
+                lines.append(f"{name}_count{suffix} {series.count}")
+        return "\n".join(lines) + "\n"
+
+    async def handle_scrape(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            if request.split()[1:2] == [b"/metrics"]:
+                body, status = self.render().encode("utf-8"), "200 OK"
+            else:
+                body, status = b"not found\n", "404 Not Found"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+            await writer.drain()
+        except (ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self, port=9108, summary_interval=60):
+        # Once per process, on whichever event loop gets here first
+        if self.tasks:
+            return
+        loop = asyncio.get_running_loop()
+        if port:
+            self.tasks.append(loop.create_task(self.serve(port)))
+        if summary_interval:
+            self.tasks.append(loop.create_task(self.log_summary(summary_interval)))
+
+    async def serve(self, port):
+        try:
+            self.server = await asyncio.start_server(self.handle_scrape, "127.0.0.1", port)
+            print(f"📊 Metrics on http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            print(f"Cannot serve metrics on port {port}", e)
+
+    async def log_summary(self, interval):
+        last_messages = self.total("chat_messages_total")
+        last_counts = self.merged("chat_message_seconds").counts
+        last_time = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            messages = self.total("chat_messages_total")
+            handling = self.merged("chat_message_seconds")
+            window = [a - b for a, b in zip(handling.counts, last_counts)]
+            helix = self.merged("helix_request_seconds")
+            wait = self.merged("chat_outbox_wait_seconds")
+            print(f"📊 {messages - last_messages} msgs ({(messages - last_messages) / (now - last_time):.1f}/s)"
+                  f" | p99 handling {handling.quantile(0.99, window) * 1000:.2f} ms"
+                  f" | helix {helix.count} req p99 {helix.quantile(0.99) * 1000:.0f} ms"
+                  f" | sent {self.total('chat_sent_total')} p99 behind {wait.quantile(0.99):.1f} s"
+                  f" | outbox {self.total('chat_outbox_depth')}")
+            last_messages, last_counts, last_time = messages, handling.counts[:], now
+
+METRICS = MetricsRegistry()
+
+HELIX_ENDPOINT = "https://api.twitch.tv/helix"
+AUTH_ENDPOINT = "https://id.twitch.tv/oauth2"
+IRC_ENDPOINT = "wss://irc-ws.chat.twitch.tv:443"
+
+def get_endpoint(name, default):
+    # TWITCH_API_ENDPOINT, TWITCH_AUTH_ENDPOINT and TWITCH_IRC_ENDPOINT point the bot at
+    # something other than Twitch, e.g. twitch_standin.py
+    return (os.environ.get(name) or default).rstrip("/")
+
+def use_chat_endpoints(bot):
+    # twitchio 2 connects to a module level HOST and validates its token against
+    # id.twitch.tv on its own, so both are redirected here when the endpoints are overridden
+    irc_endpoint = get_endpoint("TWITCH_IRC_ENDPOINT", IRC_ENDPOINT)
+    auth_endpoint = get_endpoint("TWITCH_AUTH_ENDPOINT", AUTH_ENDPOINT)
+    if irc_endpoint != IRC_ENDPOINT:
+        import twitchio.websocket
+        twitchio.websocket.HOST = irc_endpoint
+    if auth_endpoint == AUTH_ENDPOINT:
+        return
+    from twitchio.errors import AuthenticationError
+    http = bot._http
+
+    async def validate(*, token=None):
+        if http.session is None:
+            http.session = aiohttp.ClientSession()
+        headers = {"Authorization": f"OAuth {token or http.token}"}
+        async with http.session.get(f"{auth_endpoint}/validate", headers=headers) as response:
+            if response.status == 401:
+                raise AuthenticationError("Invalid or unauthorized Access Token passed.")
+            if response.status != 200:
+                raise Exception(f"Unable to validate Access Token: {await response.text()}")
+            data = await response.json()
+        if not http.nick:
+            http.nick = data.get("login")
+            http.user_id = data.get("user_id") and int(data["user_id"])
+            http.client_id = data.get("client_id")
+        return data
+    http.validate = validate
+
+class TwitchAuth:
+    def __init__(self, client_id, client_secret, token_receiver_endpoint):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.auth_endpoint = get_endpoint("TWITCH_AUTH_ENDPOINT", AUTH_ENDPOINT)
+        self.api_endpoint = get_endpoint("TWITCH_API_ENDPOINT", HELIX_ENDPOINT)
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = None  # Epoch seconds, when known
+        self.scopes = ["channel:read:subscriptions","chat:read","chat:edit"]
+        self.token_receiver_endpoint = token_receiver_endpoint
+
+    def get_user_login_url(self):
+        state = generate_random_string(16)
+        url = f"{self.auth_endpoint}/authorize?response_type=code&client_id={self.client_id}&redirect_uri={self.token_receiver_endpoint}/callback&scope={'%20'.join(self.scopes)}&state={state}"
+        return { "url": url, "state": state }
+    
+    def poll_for_token_from_receiver(self, state, interval=5):
+        url = f"{self.token_receiver_endpoint}/token/{state}"
+        while True:
+            response = requests.get(url)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                time.sleep(interval)
+
+    def refresh_access_token(self):
+        if not self.refresh_token:
+            raise Exception("No refresh token")
+            
+        url = f"{self.auth_endpoint}/token"
+        data = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "refresh_token": self.refresh_token,
+            "grant_type": "refresh_token"
+        }
+        
+        response = requests.post(url, data=data)
+        if response.status_code == 200:
+            token_data = response.json()
+            self.access_token = token_data["access_token"]
+            self.refresh_token = token_data.get("refresh_token", self.refresh_token)
+            return token_data
+        else:
+            raise Exception(f"Cannot refresh token: {response.text}")
+    
+    def save_tokens(self, filename="tokens.json"):
+        token_data = {
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_at": self.expires_at
+        }
+        tmp_path = filename + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(token_data, f)
+        os.replace(tmp_path, filename)
+    
+    def load_tokens(self, filename="tokens.json"):
+        if os.path.exists(filename):
+            with open(filename, "r") as f:
+                token_data = json.load(f)
+                self.access_token = token_data.get("access_token")
+                self.refresh_token = token_data.get("refresh_token")
+                self.expires_at = token_data.get("expires_at")
+                return True
+        return False
+    
+    def validate_token(self):
+        if not self.access_token:
+            return False
+            
+        url = f"{self.auth_endpoint}/validate"
+        headers = {
+            "Authorization": f"Bearer {self.access_token}"
+        }
+        
+        response = requests.get(url, headers=headers)
+        return response.status_code == 200
+
+class AsyncTwitchAuth(TwitchAuth):
+    # Login and token upkeep without blocking anything: the token receiver is polled with
+    # exponential backoff and jitter, validations are cached, and once started a background
+    # task refreshes the token before it expires and hands the new one to every listener.
+    def __init__(self, client_id, client_secret, token_receiver_endpoint, token_file="tokens.json", validate_ttl=300, refresh_margin=300):
+        super().__init__(client_id, client_secret, token_receiver_endpoint)
+        self.token_file = token_file
+        self.validate_ttl = validate_ttl
+        self.refresh_margin = refresh_margin
+        self.validated = None  # (access_token, valid, checked_at)
+        self.listeners = []
+        self.session = None
+        self.task = None
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15))
+        return self.session
+
+    async def close(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+        self.task = None
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def add_listener(self, callback):
+        # callback(access_token) runs on the event loop after every refresh
+        self.listeners.append(callback)
+
+    def set_token_data(self, token_data):
+        self.access_token = token_data["access_token"]
+        self.refresh_token = token_data.get("refresh_token", self.refresh_token)
+        expires_in = token_data.get("expires_in")
+        self.expires_at = time.time() + expires_in if expires_in else None
+        self.validated = (self.access_token, True, time.monotonic())
+        self.save_tokens(self.token_file)
+
+    def load_tokens(self, filename=None):
+        return super().load_tokens(filename or self.token_file)
+
+    async def poll_for_token_from_receiver(self, state, initial_delay=1.0, max_delay=30.0, timeout=600):
+        # Full jitter: each wait is random up to a cap that doubles per attempt, so many
+        # clients polling the same receiver do not fall into step
+        url = f"{self.token_receiver_endpoint}/token/{state}"
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+        while time.monotonic() < deadline:
+            try:
+                async with self.get_session().get(url) as response:
+                    if response.status == 200:
+                        token_data = await response.json()
+                        self.set_token_data(token_data)
+                        return token_data
+            except aiohttp.ClientError as e:
+                print("Token receiver is not reachable", e)
+            await asyncio.sleep(random.uniform(0, delay))
+            delay = min(delay * 2, max_delay)
+        raise Exception("Login timed out")
+
+    async def validate_token(self, force=False):
+        if not self.access_token:
+            return False
+        if not force and self.validated and self.validated[0] == self.access_token and time.monotonic() - self.validated[2] < self.validate_ttl:
+            return self.validated[1]
+        headers = {"Authorization": f"OAuth {self.access_token}"}
+        async with self.get_session().get(f"{self.auth_endpoint}/validate", headers=headers) as response:
+            valid = response.status == 200
+            if valid:
+                expires_in = (await response.json()).get("expires_in")
+                self.expires_at = time.time() + expires_in if expires_in else None
+        self.validated = (self.access_token, valid, time.monotonic())
+        return valid
+
+    async def refresh_access_token(self):
+        if not self.refresh_token:
+            raise Exception("No refresh token")
+        data = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "refresh_token": self.refresh_token,
+            "grant_type": "refresh_token"
+        }
+        async with self.get_session().post(f"{self.auth_endpoint}/token", data=data) as response:
+            if response.status != 200:
+                raise Exception(f"Cannot refresh token: {await response.text()}")
+            token_data = await response.json()
+        self.set_token_data(token_data)
+        for callback in self.listeners:
+            try:
+                callback(self.access_token)
+            except Exception as e:
+                print("Token listener failed", e)
+        print("🔑 Access token refreshed")
+        return token_data
+
+    async def ensure_token(self):
+        # A usable token from disk, refreshed if the stored one no longer validates
+        if not self.access_token:
+            self.load_tokens()
+        if await self.validate_token():
+            return self.access_token
+        if self.refresh_token:
+            try:
+                await self.refresh_access_token()
+                return self.access_token
+            except Exception as e:
+                print("Cannot refresh stored token", e)
+        return None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.keep_fresh())
+
+    async def keep_fresh(self):
+        # Twitch wants tokens validated hourly; refresh_margin seconds before expiry we refresh,
+        # retrying with backoff while the old token is still good
+        retry_delay = 5
+        checked = False
+        while True:
+            if self.expires_at is not None:
+                due = self.expires_at - self.refresh_margin - time.time()
+            else:
+                due = 3600 if checked else 0
+            if due > 0:
+                await asyncio.sleep(min(due, 3600))
+            checked = True
+            try:
+                expiring = self.expires_at is not None and self.expires_at - self.refresh_margin <= time.time()
+                if expiring or not await self.validate_token(force=True):
+                    await self.refresh_access_token()
+                retry_delay = 5
+            except Exception as e:
+                print("Cannot refresh access token", e)
+                await asyncio.sleep(random.uniform(0, retry_delay))
+                retry_delay = min(retry_delay * 2, 300)
+
+class TwitchAPI:
+    def __init__(self, client_id="", client_secret="", access_token=""):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token = access_token
+        self.endpoint = get_endpoint("TWITCH_API_ENDPOINT", HELIX_ENDPOINT)
+
+    def set_access_token(self, access_token):
+        self.access_token = access_token
+
+    def get_headers(self, token=""):
+        return {
+            "Client-ID": self.client_id,
+            "Authorization": f"Bearer {token if token else self.access_token}",
+        }
+    
+    def get_broadcaster_subscriptions(self, broadcaster_id, cursor=None):
+        url = f"{self.endpoint}/subscriptions?broadcaster_id={broadcaster_id}&first=100"
+        if cursor:
+            url += f"&after={cursor}"
+        headers = self.get_headers()
+        response = requests.get(url, headers=headers)
+        return response.json()
+        
+    def get_user(self, login):
+        url = f"{self.endpoint}/users?login={login}"
+        headers = self.get_headers()
+        response = requests.get(url, headers=headers)
+        return response.json()
+    
+    def get_user_by_token(self, token):
+        url = f"{self.endpoint}/users"
+        headers = self.get_headers(token)
+        response = requests.get(url, headers=headers)
+        return response.json()
+
+class AsyncTwitchAPI(TwitchAPI):
+    # Same Helix calls as TwitchAPI but awaitable, sharing one keep-alive session
+    # so they can run on the bot's event loop without blocking chat handling.
+    def __init__(self, client_id="", client_secret="", access_token="", user_cache_ttl=300, ratelimit_reserve=5):
+        super().__init__(client_id, client_secret, access_token)
+        self.session = None
+        self.user_cache = {}
+        self.user_cache_ttl = user_cache_ttl
+        self.ratelimit_reserve = ratelimit_reserve
+        self.ratelimit_remaining = None
+        self.ratelimit_reset = 0
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=15)
+            )
+        return self.session
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def update_ratelimit(self, headers):
+        remaining = headers.get("Ratelimit-Remaining")
+        reset = headers.get("Ratelimit-Reset")
+        if remaining is not None:
+            self.ratelimit_remaining = int(remaining)
+        if reset is not None:
+            self.ratelimit_reset = int(reset)
+
+    async def wait_for_ratelimit(self):
+        # Helix refills the bucket at Ratelimit-Reset (epoch seconds); once we are
+        # down to the reserve, hold new requests until then instead of eating 429s.
+        if self.ratelimit_remaining is not None and self.ratelimit_remaining <= self.ratelimit_reserve:
+            delay = self.ratelimit_reset - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.ratelimit_remaining = None
+        elif self.ratelimit_remaining is not None:
+            self.ratelimit_remaining -= 1
+
+    async def request(self, url, token="", retries=3, backoff=0.5):
+        # 429s wait for the rate limit window; dropped connections, timeouts and 5xx
+        # are retried after a jittered exponential backoff
+        session = self.get_session()
+        endpoint = url[len(self.endpoint):].split("?", 1)[0].strip("/")
+        latency = METRICS.histogram("helix_request_seconds", "Helix request latency", endpoint=endpoint)
+        for attempt in range(retries + 1):
+            await self.wait_for_ratelimit()
+            started = time.perf_counter()
+            try:
+                async with session.get(url, headers=self.get_headers(token)) as response:
+                    latency.observe(time.perf_counter() - started)
+                    METRICS.counter("helix_responses_total", "Helix responses by status", endpoint=endpoint, status=str(response.status)).inc()
+                    self.update_ratelimit(response.headers)
+                    if response.status == 429 and attempt < retries:
+                        self.ratelimit_remaining = 0
+                        self.ratelimit_reset = max(self.ratelimit_reset, int(time.time()) + 1)
+                        continue
+                    if response.status < 500 or attempt == retries:
+                        return await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                METRICS.counter("helix_responses_total", "Helix responses by status", endpoint=endpoint, status="error").inc()
+                if attempt == retries:
+                    raise
+            await asyncio.sleep(random.uniform(0, backoff * 2 ** attempt))
+
+    async def get_broadcaster_subscriptions(self, broadcaster_id, cursor=None):
+        url = f"{self.endpoint}/subscriptions?broadcaster_id={broadcaster_id}&first=100"
+        if cursor:
+            url += f"&after={cursor}"
+        return await self.request(url)
+
+    async def get_user(self, login):
+        key = login.lower()
+        cached = self.user_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        response = await self.request(f"{self.endpoint}/users?login={login}")
+        if response.get("data"):
+            self.user_cache[key] = (time.monotonic() + self.user_cache_ttl, response)
+        return response
+
+    async def get_user_by_token(self, token):
+        return await self.request(f"{self.endpoint}/users", token=token)
+
+    async def get_user_subscriptions(self, broadcaster_id, user_ids):
+        # Helix accepts up to 100 user_id filters on the broadcaster subscriptions endpoint
+        url = f"{self.endpoint}/subscriptions?broadcaster_id={broadcaster_id}"
+        url += "".join(f"&user_id={user_id}" for user_id in user_ids)
+        return await self.request(url)
+
+class SubscriberCache:
+    # Snapshots are keyed by channel login so they load before any Helix call succeeds
+    def __init__(self, directory=".", max_age=600):
+        self.directory = directory
+        self.max_age = max_age
+        self.updated_at = {}
+
+    def get_path(self, channel):
+        return os.path.join(self.directory, f"subscribers_{channel.lower()}.json")
+
+    def load(self, channel):
+        if not channel:
+            return None
+        path = self.get_path(channel)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            modified = os.path.getmtime(path)
+        except (OSError, ValueError) as e:
+            print("Cannot read subscribers cache", e)
+            return None
+        if snapshot.get("channel") != channel.lower():
+            return None
+        # An unchanged crawl only touches the file, so its mtime can be newer than updated_at
+        self.updated_at[channel.lower()] = max(snapshot.get("updated_at", 0), modified)
+        snapshot["subscriptions"] = {
+            login: SubscriptionRecord(sub["tier"] if isinstance(sub, dict) else sub)
+            for login, sub in snapshot["subscriptions"].items()
+        }
+        return snapshot
+
+    def save(self, channel, subscriptions):
+        updated_at = time.time()
+        path = self.get_path(channel)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "channel": channel.lower(),
+                "updated_at": updated_at,
+                "subscriptions": {login: sub.tier for login, sub in subscriptions.items()}
+            }, f)
+        os.replace(tmp_path, path)
+        self.updated_at[channel.lower()] = updated_at
+
+    def touch(self, channel):
+        # Marks the snapshot fresh without rewriting it
+        path = self.get_path(channel)
+        if os.path.exists(path):
+            os.utime(path)
+        self.updated_at[channel.lower()] = time.time()
+
+    def is_stale(self, channel):
+        return time.time() - self.updated_at.get(channel.lower(), 0) >= self.max_age
+
+    @staticmethod
+    def diff(old, new):
+        added = [login for login in new if login not in old]
+        removed = [login for login in old if login not in new]
+        changed = [login for login, sub in new.items() if login in old and old[login].tier != sub.tier]
+        return added, removed, changed
+
+class SubscriptionResolver:
+    batch_size = 100
+
+    def __init__(self, helix, on_tier=None):
+        self.helix = helix
+        self.on_tier = on_tier
+        self.tiers = {}
+        self.pending = {}
+        self.tasks = set()
+
+    def get(self, login):
+        return self.tiers.get(login)
+
+    def remember(self, login, tier):
+        if self.tiers.get(login) != tier:
+            self.tiers[login] = tier
+            if self.on_tier:
+                self.on_tier(login, tier)
+
+    def queue(self, broadcaster_id, login, user_id):
+        # Collect unknown users while the vote runs and look them up a full batch at a time;
+        # without a broadcaster id (get_user failed) Helix could only answer with an error
+        if not broadcaster_id or login in self.tiers or login in self.pending or not user_id:
+            return
+        self.pending[login] = user_id
+        if len(self.pending) >= self.batch_size:
+            self.start_batch(broadcaster_id)
+
+    def start_batch(self, broadcaster_id):
+        batch = dict(list(self.pending.items())[:self.batch_size])
+        for login in batch:
+            del self.pending[login]
+        task = asyncio.create_task(self.resolve_batch(broadcaster_id, batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def resolve_batch(self, broadcaster_id, batch):
+        try:
+            response = await self.helix.get_user_subscriptions(broadcaster_id, list(batch.values()))
+        except Exception as e:
+            print("Cannot resolve subscriptions", e)
+            return
+        if "data" not in response:
+            # 401/403 for a token that isn't the broadcaster's, or a 429/5xx that outlasted the
+            # retries: no answer about these users, so they keep their cached or tag tier
+            print("Cannot resolve subscriptions", response.get("status"), response.get("message"))
+            return
+        tiers = {sub["user_id"]: sub["tier"] for sub in response.get("data", [])}
+        for login, user_id in batch.items():
+            self.remember(login, tiers.get(user_id, "0000"))
+
+    async def resolve(self, broadcaster_id, users):
+        for login, user_id in users.items():
+            self.queue(broadcaster_id, login, user_id)
+        while self.pending:
+            self.start_batch(broadcaster_id)
+        if self.tasks:
+            await asyncio.gather(*self.tasks)
+
+class KeywordMatcher:
+    EXACT = "exact"
+    FIRST_TOKEN = "first token"
+    CONTAINS = "contains"
+    MODES = (EXACT, FIRST_TOKEN, CONTAINS)
+
+    def __init__(self, patterns=(), mode=EXACT):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown match mode: {mode}")
+        self.mode = mode
+        self.compile(patterns)
+
+    def compile(self, patterns):
+        # Aho-Corasick automaton: one pass over the message finds every pattern in it,
+        # so the cost depends on the message length and not on how many choices there are.
+        # Only called from __init__: the bot thread may be searching a published matcher, so
+        # new patterns get a new KeywordMatcher instead of a rebuild in place.
+        self.patterns = frozenset(p for p in patterns if p)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+        for pattern in self.patterns:
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                node = next_node
+            self.output[node] = pattern
+
+        # dict_suffix[n] is the nearest node on n's fail chain that ends a pattern
+        self.dict_suffix = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.dict_suffix[child] = self.fail[child] if self.output[self.fail[child]] else self.dict_suffix[self.fail[child]]
+                queue.append(child)
+
+    def match(self, text):
+        if self.mode == self.EXACT:
+            return text if text in self.patterns else None
+        if self.mode == self.FIRST_TOKEN:
+            token = text.split(None, 1)[0].strip(PUNCTUATION) if text else ""
+            return token if token in self.patterns else None
+        return self.search(text)
+
+    def search(self, text):
+        # Returns the first pattern that stands as a whole word, longest one when several end together
+        goto, fail, output, dict_suffix = self.goto, self.fail, self.output, self.dict_suffix
+        node = 0
+        length = len(text)
+        for end, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            found = node if output[node] else dict_suffix[node]
+            while found:
+                pattern = output[found]
+                start = end - len(pattern) + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end + 1 == length or not text[end + 1].isalnum()):
+                    return pattern
+                found = dict_suffix[found]
+        return None
+
+class CommandRouter:
+    # Maps a normalized message to the handlers it triggers. Rebuilt whenever the choices or
+    # keywords change so that event_message only pays for a single dict lookup per message.
+    # The routes and their matcher are built aside and published together in self.table, as
+    # the GUI thread recompiles while the bot thread may be routing.
+    def __init__(self, match_mode=KeywordMatcher.EXACT):
+        self.commands = {}
+        self.arg_commands = {}
+        self.table = ({}, KeywordMatcher(mode=match_mode))
+
+    @property
+    def routes(self):
+        return self.table[0]
+
+    @property
+    def matcher(self):
+        return self.table[1]
+
+    def add_command(self, name, handler, takes_args=False):
+        # Commands taking arguments are matched on their first word and get the whole message
+        if takes_args:
+            self.arg_commands[name.upper()] = handler
+        else:
+            self.commands[name.upper()] = handler
+
+    def compile(self, *groups):
+        routes = {}
+        for tokens, handler in groups:
+            for token in frozenset(tokens):
+                routes[token] = routes.get(token, ()) + (handler,)
+        matcher = KeywordMatcher(routes, self.matcher.mode)
+        for name, handler in self.commands.items():
+            routes[name] = routes.get(name, ()) + (handler,)
+        self.table = (routes, matcher)
+
+    def set_match_mode(self, mode):
+        routes, matcher = self.table
+        self.table = (routes, KeywordMatcher(matcher.patterns, mode))
+
+    def route(self, content):
+        routes, matcher = self.table
+        handlers = routes.get(content)
+        if handlers is None and self.arg_commands and content.startswith("!"):
+            handler = self.arg_commands.get(content.split(None, 1)[0])
+            if handler is not None:
+                return content, (handler,)
+        if handlers is not None or matcher.mode == KeywordMatcher.EXACT:
+            return content, handlers
+        token = matcher.match(content)
+        if token is None:
+            return None, None
+        return token, routes[token]
+
+class ChatOutbox:
+    # Everything the bot says goes through here. A token bucket keeps us inside Twitch's
+    # send limits, announcements always go first and per-user acknowledgements that pile up
+    # during a rush are merged into one line per group ("A: user1, user2, +37 more").
+    max_length = 500
+
+    def __init__(self, rate=20, per=30, min_interval=1.0, max_names=10):
+        self.set_limits(rate, per, min_interval)
+        self.max_names = max_names
+        self.announcements = collections.deque()
+        self.acks = {}
+        self.queued_at = {}  # (channel, text) or (channel, label, "ack") -> when it was queued
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.sent = 0
+        self.merged = 0
+        self.sent_counter = METRICS.counter("chat_sent_total", "Chat messages sent")
+        self.merged_counter = METRICS.counter("chat_acks_merged_total", "Acknowledgements folded into another line")
+        self.send_latency = METRICS.histogram("chat_send_seconds", "Time channel.send takes")
+        self.wait_latency = METRICS.histogram("chat_outbox_wait_seconds", "Time a message waits in the outbox",
+                                              bounds=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+
+    def set_limits(self, rate, per, min_interval=0.0):
+        self.capacity = rate
+        self.tokens = rate
+        self.refill_rate = rate / per
+        self.min_interval = min_interval
+        self.last_refill = time.monotonic()
+        self.last_sent = 0.0
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def announce(self, channel, text):
+        if (channel, text) not in self.announcements:
+            self.announcements.append((channel, text))
+            self.queued_at.setdefault((channel, text), time.monotonic())
+            self.wakeup.set()
+
+    def acknowledge(self, channel, label, single_text, user):
+        # Users are dict keys so a viewer repeating the keyword is named once per line
+        group = self.acks.get((channel, label))
+        if group is None:
+            self.acks[(channel, label)] = (single_text, {user: None})
+            self.queued_at.setdefault((channel, label, "ack"), time.monotonic())
+        else:
+            group[1][user] = None
+        self.wakeup.set()
+
+    def depth(self):
+        return len(self.announcements) + sum(len(users) for _, users in self.acks.values())
+
+    def stats(self):
+        return {
+            "announcements": len(self.announcements),
+            "ack_groups": len(self.acks),
+            "depth": self.depth(),
+            "sent": self.sent,
+            "merged": self.merged
+        }
+
+    def format_ack(self, label, single_text, users):
+        if len(users) == 1:
+            return single_text.replace("{user}", users[0])
+        line = f"{label}: {users[0]}"
+        shown = 1
+        for user in users[1:self.max_names]:
+            more = f", +{len(users) - shown - 1} more"
+            if len(line) + len(user) + 2 + len(more) > self.max_length:
+                break
+            line += f", {user}"
+            shown += 1
+        if shown < len(users):
+            line += f", +{len(users) - shown} more"
+        return line
+
+    def next_message(self):
+        if self.announcements:
+            message = self.announcements.popleft()
+            self.observe_wait(message)
+            return message
+        (channel, label), (single_text, users) = next(iter(self.acks.items()))
+        del self.acks[(channel, label)]
+        self.observe_wait((channel, label, "ack"))
+        self.merged += len(users) - 1
+        self.merged_counter.inc(len(users) - 1)
+        return channel, self.format_ack(label, single_text, list(users))
+
+    def observe_wait(self, key):
+        queued = self.queued_at.pop(key, None)
+        if queued is not None:
+            self.wait_latency.observe(time.monotonic() - queued)
+
+    async def take_token(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+            self.last_refill = now
+            wait = max(self.last_sent + self.min_interval - now, 0)
+            if self.tokens < 1:
+                wait = max(wait, (1 - self.tokens) / self.refill_rate)
+            if wait <= 0:
+                self.tokens -= 1
+                self.last_sent = now
+                return
+            await asyncio.sleep(wait)
+
+    async def run(self):
+        while True:
+            if not self.announcements and not self.acks:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            # Wait for the token before picking the message so whatever arrived meanwhile
+            # gets merged into it and late announcements can still jump the line
+            await self.take_token()
+            channel, text = self.next_message()
+            try:
+                started = time.perf_counter()
+                await channel.send(text)
+                self.send_latency.observe(time.perf_counter() - started)
+                self.sent += 1
+                self.sent_counter.inc()
+            except Exception as e:
+                print("Cannot send chat message", e)
+
+class QueueLane:
+    # Viewers of one priority in arrival order. A removed viewer leaves None behind and a
+    # Fenwick tree over the live slots counts the viewers ahead of a slot in O(log n).
+    def __init__(self, users=()):
+        self.users = []
+        self.tree = [0]
+        self.live = 0
+        for user in users:
+            self.append(user)
+
+    def __iter__(self):
+        return (user for user in self.users if user is not None)
+
+    def prefix(self, slot):
+        # Live viewers in users[:slot]
+        total = 0
+        while slot > 0:
+            total += self.tree[slot]
+            slot &= slot - 1
+        return total
+
+    def append(self, user):
+        self.users.append(user)
+        node = len(self.users)
+        # The new node covers slots (node - lowbit, node]; all but the last are counted already
+        self.tree.append(self.prefix(node - 1) - self.prefix(node - (node & -node)) + 1)
+        self.live += 1
+        return node - 1
+
+    def remove(self, slot):
+        self.users[slot] = None
+        node = slot + 1
+        while node < len(self.tree):
+            self.tree[node] -= 1
+            node += node & -node
+        self.live -= 1
+
+    def find(self, rank):
+        # Slot of the live viewer with 0-based rank, by walking down the tree
+        slot = 0
+        remaining = rank + 1
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            node = slot + step
+            if node < len(self.tree) and self.tree[node] < remaining:
+                slot = node
+                remaining -= self.tree[node]
+            step >>= 1
+        return slot
+
+class ViewerQueue:
+    # Priority queue with a hash index. Every priority has its own QueueLane, so a join is an
+    # append to its lane, O(log n), and a position is the live count of the higher lanes plus
+    # a prefix sum in its own, O(p + log n) for p distinct priorities (at most the four tiers).
+    # Membership is O(1) and removal O(log n) per user, with lanes compacted once half empty.
+    def __init__(self):
+        self.clear()
+
+    def __contains__(self, user):
+        return user in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        for priority in self.priorities:
+            yield from self.lanes[priority]
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            return list(itertools.islice(self, start, stop, step)) if step > 0 else list(self)[item]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("queue index out of range")
+        for priority in self.priorities:
+            lane = self.lanes[priority]
+            if item < lane.live:
+                return lane.users[lane.find(item)]
+            item -= lane.live
+
+    def append(self, user, priority=0):
+        if user in self.index:
+            return
+        lane = self.lanes.get(priority)
+        if lane is None:
+            lane = self.lanes[priority] = QueueLane()
+            self.priorities.append(priority)
+            self.priorities.sort(reverse=True)
+        self.index[user] = (priority, lane.append(user))
+
+    def position(self, user):
+        entry = self.index.get(user)
+        if entry is None:
+            return None
+        priority, slot = entry
+        ahead = sum(self.lanes[higher].live for higher in self.priorities if higher > priority)
+        return ahead + self.lanes[priority].prefix(slot) + 1
+
+    def remove(self, user):
+        self.remove_many([user])
+
+    def remove_many(self, users):
+        touched = set()
+        for user in set(users):
+            entry = self.index.pop(user, None)
+            if entry is not None:
+                self.lanes[entry[0]].remove(entry[1])
+                touched.add(entry[0])
+        for priority in touched:
+            lane = self.lanes[priority]
+            if not lane.live:
+                del self.lanes[priority]
+                self.priorities.remove(priority)
+            elif len(lane.users) > 2 * lane.live + 64:
+                lane = self.lanes[priority] = QueueLane(lane)
+                for slot, user in enumerate(lane.users):
+                    self.index[user] = (priority, slot)
+
+    def clear(self):
+        self.lanes = {}
+        self.priorities = []  # Highest first
+        self.index = {}
+
+class SubscriptionRecord:
+    # Only the tier of a Helix subscription is ever read, so that is all we keep per login
+    __slots__ = ("tier",)
+
+    def __init__(self, tier):
+        self.tier = sys.intern(tier)
+
+class VoteStore:
+    # Compact storage for one vote. Voters get an integer id in vote order; names sit in one
+    # list, choice index and tier code in typed arrays, and the name -> id lookup is an
+    # open-addressing table of ids in an array, so no per-voter dict, set or int objects exist.
+    TIERS = ("0000", "1000", "2000", "3000")
+    TIER_CODES = {tier: code for code, tier in enumerate(TIERS)}
+
+    def __init__(self, choices=()):
+        self.reset(choices)
+
+    def reset(self, choices=()):
+        self.choices = list(choices)
+        self.choice_index = {choice: idx for idx, choice in enumerate(self.choices)}
+        self.users = []
+        self.choice_of = array.array("H")
+        self.tier_of = bytearray()
+        self.slots = array.array("i", [-1]) * 1024
+
+    def clear(self):
+        self.reset(self.choices)
+
+    def find(self, user):
+        # Linear probing; returns (id or -1, slot)
+        slots, users = self.slots, self.users
+        mask = len(slots) - 1
+        slot = hash(user) & mask
+        while True:
+            uid = slots[slot]
+            if uid == -1 or users[uid] == user:
+                return uid, slot
+            slot = (slot + 1) & mask
+
+    def grow(self):
+        slots = array.array("i", [-1]) * (len(self.slots) * 2)
+        mask = len(slots) - 1
+        for uid, user in enumerate(self.users):
+            slot = hash(user) & mask
+            while slots[slot] != -1:
+                slot = (slot + 1) & mask
+            slots[slot] = uid
+        self.slots = slots
+
+    def __contains__(self, user):
+        return self.find(user)[0] != -1
+
+    def __len__(self):
+        return len(self.users)
+
+    def __getitem__(self, user):
+        uid = self.find(user)[0]
+        if uid == -1:
+            raise KeyError(user)
+        return self.choices[self.choice_of[uid]]
+
+    def add(self, user, choice, tier):
+        uid, slot = self.find(user)
+        if uid != -1:
+            return False
+        idx = self.choice_index.get(choice)
+        if idx is None:
+            idx = len(self.choices)
+            self.choices.append(choice)
+            self.choice_index[choice] = idx
+        self.slots[slot] = len(self.users)
+        self.users.append(user)
+        self.choice_of.append(idx)
+        self.tier_of.append(self.TIER_CODES.get(tier, 0))
+        if len(self.users) * 2 > len(self.slots):
+            self.grow()
+        return True
+
+    def get_tier(self, user):
+        uid = self.find(user)[0]
+        return None if uid == -1 else self.TIERS[self.tier_of[uid]]
+
+    def set_tier(self, user, tier):
+        uid = self.find(user)[0]
+        if uid != -1:
+            self.tier_of[uid] = self.TIER_CODES.get(tier, 0)
+
+    def columns(self):
+        # (users, choice_of, tier_of, choices) without copying the voters. reset() swaps in new
+        # containers rather than clearing these, so they stay this vote's after the next starts.
+        return self.users, self.choice_of, self.tier_of, list(self.choices)
+
+    def items(self):
+        choices = self.choices
+        for user, idx in zip(self.users, self.choice_of):
+            yield user, choices[idx]
+
+    def entries(self):
+        choices, tiers = self.choices, self.TIERS
+        for user, idx, code in zip(self.users, self.choice_of, self.tier_of):
+            yield user, choices[idx], tiers[code]
+
+    def iter_voters(self, choice):
+        idx = self.choice_index.get(choice)
+        for user, user_choice in zip(self.users, self.choice_of):
+            if user_choice == idx:
+                yield user
+
+class VoteTally:
+    # Running per-choice counters, updated as each vote arrives. Subscribers count double by
+    # default; pass tier_weights to change that. The votes themselves live in a VoteStore.
+    DEFAULT_WEIGHTS = {"0000": 1, "1000": 2, "2000": 2, "3000": 2}
+
+    def __init__(self, store=None, tier_weights=None):
+        self.store = store if store is not None else VoteStore()
+        self.tier_weights = dict(tier_weights or self.DEFAULT_WEIGHTS)
+        self.reset(self.store.choices)
+
+    def reset(self, choices=()):
+        self.store.reset(choices)
+        self.counts = {choice: 0 for choice in choices}
+        self.weighted = {choice: 0 for choice in choices}
+        self.total = 0
+
+    def get_weight(self, tier):
+        return self.tier_weights.get(tier or "0000", 1)
+
+    def add(self, user, choice, tier):
+        if not self.store.add(user, choice, tier):
+            return
+        self.counts[choice] = self.counts.get(choice, 0) + 1
+        self.weighted[choice] = self.weighted.get(choice, 0) + self.get_weight(tier)
+        self.total += 1
+
+    def retier(self, user, tier):
+        old_tier = self.store.get_tier(user)
+        if old_tier is None or old_tier == tier:
+            return
+        self.weighted[self.store[user]] += self.get_weight(tier) - self.get_weight(old_tier)
+        self.store.set_tier(user, tier)
+
+    def get_tier(self, user):
+        return self.store.get_tier(user)
+
+    def snapshot(self):
+        standings = sorted(
+            ((choice, self.counts[choice], self.weighted[choice]) for choice in self.counts),
+            key=lambda standing: standing[2],
+            reverse=True
+        )
+        return {"total": self.total, "standings": standings}
+
+    def format_standings(self, limit=5):
+        standings = self.snapshot()["standings"][:limit]
+        return " | ".join(f"{choice}: {weighted} ({count} คน)" for choice, count, weighted in standings)
+
+class JournalState:
+    # What the journal describes: the latest vote (open or finished) and the viewer queue
+    def __init__(self):
+        self.choices = []
+        self.weights = None  # Tier weights of the latest vote; journals before weights have none
+        self.votes = VoteStore()
+        self.vote_open = False
+        self.queue = {}
+
+    def apply(self, event):
+        kind = event["event"]
+        if kind == "vote_start":
+            self.choices = event["choices"]
+            self.weights = event.get("weights")
+            self.votes.reset(self.choices)
+            self.vote_open = True
+        elif kind == "vote":
+            self.votes.add(event["user"], event["choice"], event.get("tier"))
+        elif kind == "tier":
+            self.votes.set_tier(event["user"], event["tier"])
+        elif kind == "vote_end":
+            self.vote_open = False
+        elif kind == "queue_join":
+            # Older journals stored the tier negated, back when the queue sorted ascending
+            self.queue[event["user"]] = abs(event.get("priority", 0))
+        elif kind == "queue_remove":
+            for user in event["users"]:
+                self.queue.pop(user, None)
+        elif kind == "queue_clear":
+            self.queue.clear()
+
+    def get_vote_entries(self):
+        return list(self.votes.entries())
+
+    def iter_vote_entries(self):
+        return self.votes.entries()
+
+    def to_events(self):
+        events = [{"event": "queue_join", "user": user, "priority": priority} for user, priority in self.queue.items()]
+        if self.vote_open:
+            events.append({"event": "vote_start", "choices": self.choices, "weights": self.weights})
+            events += [{"event": "vote", "user": user, "choice": choice, "tier": tier} for user, choice, tier in self.votes.entries()]
+        return events
+
+class VoteJournal:
+    # Append-only JSON lines log of vote and queue events. Writes happen on a background
+    # thread in batches with an fsync at most every fsync_interval seconds; jobs passed to
+    # submit() run on that thread after every event recorded before them is on disk.
+    def __init__(self, filename="vote_journal.jsonl", fsync_interval=1.0, batch_size=500):
+        self.filename = filename
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+        self.events = queue.Queue()
+        self.state = JournalState()
+        self.thread = None
+
+    def restore(self):
+        # Replays the journal, then rewrites it with only the events still needed
+        state = JournalState()
+        if os.path.exists(self.filename):
+            with open(self.filename, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        state.apply(json.loads(line))
+                    except (ValueError, KeyError):
+                        continue  # Torn last line after a crash
+        tmp_path = self.filename + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for event in state.to_events():
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.filename)
+        self.state = state
+        return state
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def record(self, event, **fields):
+        fields["event"] = event
+        fields["ts"] = time.time()
+        self.events.put(fields)
+
+    def submit(self, job):
+        self.events.put(job)
+
+    def close(self):
+        if self.thread is not None:
+            self.events.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        with open(self.filename, "a", encoding="utf-8") as f:
+            last_sync = time.monotonic()
+            dirty = False
+            while True:
+                try:
+                    item = self.events.get(timeout=self.fsync_interval if dirty else None)
+                except queue.Empty:
+                    item = False  # Idle: fall through to the pending fsync
+                batch = [] if item is False else [item]
+                while item is not False and len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.events.get_nowait())
+                    except queue.Empty:
+                        break
+
+                lines = []
+                for item in batch:
+                    if isinstance(item, dict):
+                        self.state.apply(item)
+                        lines.append(json.dumps(item, ensure_ascii=False) + "\n")
+                        continue
+                    if lines:
+                        f.writelines(lines)
+                        lines = []
+                        dirty = True
+                    if item is None:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        return
+                    f.flush()
+                    os.fsync(f.fileno())
+                    dirty = False
+                    last_sync = time.monotonic()
+                    try:
+                        item(self.state)
+                    except Exception as e:
+                        print("Journal job failed", e)
+                if lines:
+                    f.writelines(lines)
+                    dirty = True
+                if dirty and time.monotonic() - last_sync >= self.fsync_interval:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    dirty = False
+                    last_sync = time.monotonic()
+
+EXPORT_TIER_LABELS = {"1000": "T1", "2000": "T2", "3000": "T3"}
+
+def iter_vote_rows(entries, get_weight):
+    for user, choice, tier in entries:
+        yield {
+            "user": user,
+            "choice": choice,
+            "tier": EXPORT_TIER_LABELS.get(tier, "None"),
+            "weight": get_weight(tier)
+        }
+
+def write_vote_export(rows, basename, export_format="csv", compress=False):
+    # Streams rows to disk one at a time, so memory stays flat however large the vote is
+    file_path = f"{basename}.{export_format}" + (".gz" if compress else "")
+    opener = gzip.open if compress else open
+    with opener(file_path, "wt", encoding="utf-8", newline="") as file:
+        if export_format == "csv":
+            writer = csv.DictWriter(file, fieldnames=["user", "choice", "tier", "weight"])
+            writer.writeheader()
+            writer.writerows(rows)
+        elif export_format == "jsonl":
+            for row in rows:
+                file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        else:
+            raise ValueError(f"Unknown export format: {export_format}")
+    return file_path
+
+class AliasTable:
+    # Walker/Vose alias method: O(n) to build, then every weighted draw is O(1)
+    def __init__(self, items, weights, rng=None):
+        self.items = list(items)
+        self.weights = list(weights)
+        self.rng = rng or random.Random()
+        count = len(self.items)
+        weights = self.weights
+        total = float(sum(weights))
+        if not count or total <= 0:
+            raise ValueError("Cannot draw from an empty pool")
+        scaled = [weight * count / total for weight in weights]
+        self.prob = [0.0] * count
+        self.alias = list(range(count))
+        small = [idx for idx, p in enumerate(scaled) if p < 1.0]
+        large = [idx for idx, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        for idx in small + large:
+            self.prob[idx] = 1.0
+
+    def draw(self):
+        idx = self.rng.randrange(len(self.items))
+        return self.items[idx] if self.rng.random() < self.prob[idx] else self.items[self.alias[idx]]
+
+    def sample(self, count, replace=True):
+        if replace:
+            return [self.draw() for _ in range(count)]
+        # Without replacement: redraw on repeats, which stays O(1) per draw while the winners
+        # are a small part of the pool. Items with weight 0 can never win, so at most the
+        # positive ones are drawn.
+        count = min(count, sum(1 for weight in self.weights if weight > 0))
+        winners = []
+        seen = set()
+        misses = 0
+        while len(winners) < count:
+            item = self.draw()
+            if item in seen:
+                misses += 1
+                if misses > 10 * count:
+                    break
+                continue
+            seen.add(item)
+            winners.append(item)
+        if len(winners) < count:
+            # Repeats dominate once the pool is nearly used up; finish on what is left
+            remaining = [(item, weight) for item, weight in zip(self.items, self.weights) if item not in seen and weight > 0]
+            rest = AliasTable([item for item, _ in remaining], [weight for _, weight in remaining], self.rng)
+            winners += rest.sample(count - len(winners), replace=False)
+        return winners
+
+class VoteScheduler:
+    # Runs a vote against an absolute deadline on the event loop's monotonic clock. Votes are
+    # judged by the tmi-sent-ts tag Twitch stamps on each message, so a message sent before the
+    # deadline still counts when it is processed late and one sent after it never does.
+    # The clock offset is learned from every message, votes or not, so it is settled before a
+    # rush; a backlog that exists from the moment the bot connects still ends up inside it.
+    def __init__(self, on_tick, on_warning, on_close, grace=1.5, max_grace=30, warning_at=10):
+        self.on_tick = on_tick
+        self.on_warning = on_warning
+        self.on_close = on_close
+        self.grace = grace
+        self.max_grace = max_grace
+        self.warning_at = warning_at
+        self.task = None
+        self.deadline = None
+        self.start_ms = 0
+        self.end_ms = 0
+        # Smallest (local clock - tmi-sent-ts) seen: clock skew plus the fastest delivery
+        self.clock_offset = None
+        self.last_sent = None  # tmi-sent-ts of the newest message handled, and when
+        self.last_seen = 0.0
+
+    def start(self, duration):
+        loop = asyncio.get_running_loop()
+        self.cancel()
+        self.deadline = loop.time() + duration
+        self.start_ms = time.time() * 1000
+        self.end_ms = self.start_ms + duration * 1000
+        self.task = loop.create_task(self.run(duration))
+
+    def cancel(self):
+        if self.task and not self.task.done() and self.task is not asyncio.current_task():
+            self.task.cancel()
+        self.task = None
+
+    def get_remaining_time(self):
+        if self.deadline is None:
+            return 0
+        return max(0, math.ceil(self.deadline - asyncio.get_running_loop().time()))
+
+    def observe(self, tags):
+        sent = tags.get("tmi-sent-ts") if tags else None
+        if not sent or not sent.isdigit():
+            return None
+        sent = int(sent)
+        offset = time.time() * 1000 - sent
+        if self.clock_offset is None or offset < self.clock_offset:
+            self.clock_offset = offset
+        self.last_sent = sent
+        self.last_seen = time.monotonic()
+        return sent
+
+    def behind_deadline(self):
+        # True while recent messages were still sent before the deadline, i.e. a backlog
+        # from inside the vote window is still being worked through
+        return (self.last_sent is not None and self.last_sent <= self.end_ms - self.clock_offset
+                and time.monotonic() - self.last_seen < self.grace)
+
+    def accepts(self, tags):
+        sent = self.observe(tags)
+        if sent is None:
+            return self.deadline is not None and asyncio.get_running_loop().time() <= self.deadline
+        return self.start_ms - self.clock_offset <= sent <= self.end_ms - self.clock_offset
+
+    async def run(self, duration):
+        loop = asyncio.get_running_loop()
+        warned = duration <= self.warning_at
+        while True:
+            remaining = self.deadline - loop.time()
+            if remaining <= 0:
+                break
+            seconds = math.ceil(remaining)
+            self.on_tick(seconds)
+            if not warned and seconds <= self.warning_at:
+                warned = True
+                self.on_warning()
+            # Wake on the next whole second of the remaining time, whatever the last tick cost
+            await asyncio.sleep(remaining - (seconds - 1))
+        self.on_tick(0)
+        # Messages sent before the deadline may still be in flight, and under load the queue
+        # of received messages can lag by more than the grace; wait that out, up to max_grace
+        closing = loop.time()
+        await asyncio.sleep(self.grace)
+        while self.behind_deadline() and loop.time() - closing < self.max_grace:
+            await asyncio.sleep(0.25)
+        await self.on_close(False)
+
+class Profiler:
+    # cProfile plus a tracemalloc diff over a window, taken on the thread of the event loop
+    # that starts it (in the integrated GUI that includes the Treeview refreshes). Reports are
+    # written off the loop to <directory>/profile_<time>.txt/.prof and memory_<time>.txt.
+    # tracemalloc is per process, so there is one Profiler per process (PROFILER) shared by
+    # every bot in it; listeners(running) hear about every start and stop.
+    def __init__(self, directory="profiles", top=30):
+        self.directory = directory
+        self.top = top
+        self.listeners = []
+        self.profile = None
+        self.snapshot = None
+        self.started_tracing = False
+        self.started_at = None
+        self.timer = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self, duration=60):
+        if self.running:
+            return False
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start(10)
+        self.snapshot = tracemalloc.take_snapshot()
+        self.started_at = time.time()
+        if duration:
+            self.timer = asyncio.get_running_loop().call_later(duration, self.stop)
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        print(f"🔬 Profiling started{f' for {duration} s' if duration else ''}")
+        self.notify(True)
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        profile, before = self.profile, self.snapshot
+        self.profile = None
+        self.snapshot = None
+        profile.disable()
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        # Someone else may have stopped tracing meanwhile; then only the CPU profile is written
+        after = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if self.started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        asyncio.get_running_loop().run_in_executor(None, self.write_reports, stamp, profile, before, after)
+        self.notify(False)
+        return True
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def notify(self, running):
+        for callback in self.listeners:
+            try:
+                callback(running)
+            except Exception as e:
+                print("Profiler listener failed", e)
+
+    def toggle(self, duration=60):
+        return self.stop() if self.running else self.start(duration)
+
+    def write_reports(self, stamp, profile, before, after):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"profile_{stamp}")
+        profile.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            stats = pstats.Stats(profile, stream=f)
+            stats.sort_stats("cumulative").print_stats(self.top)
+            stats.sort_stats("tottime").print_stats(self.top)
+        if after is None:
+            print(f"🔬 Profile written to {base}.txt")
+            return
+
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+        before, after = before.filter_traces(ignore), after.filter_traces(ignore)
+        memory_path = os.path.join(self.directory, f"memory_{stamp}.txt")
+        with open(memory_path, "w", encoding="utf-8") as f:
+            f.write(f"traced now: {sum(stat.size for stat in after.statistics('filename')) / 2**20:.1f} MiB\n")
+            f.write(f"top {self.top} allocation changes since {stamp}:\n")
+            for stat in after.compare_to(before, "lineno")[:self.top]:
+                f.write(f"{stat}\n")
+        print(f"🔬 Profile written to {base}.txt and {memory_path}")
+
+PROFILER = Profiler()
+
+def is_moderator(author):
+    return bool(author.is_mod or author.is_broadcaster)
+
+class ChannelMetrics:
+    # Per-channel counters, cheap enough to bump on every message; snapshot() turns the
+    # counts since the previous snapshot into rates.
+    def __init__(self):
+        self.messages = 0
+        self.routed = 0
+        self.handler_time = 0.0
+        self.slowest = 0.0
+        self.last_time = time.monotonic()
+        self.last_messages = 0
+        self.last_routed = 0
+
+    def record(self, elapsed):
+        self.routed += 1
+        self.handler_time += elapsed
+        if elapsed > self.slowest:
+            self.slowest = elapsed
+
+    def snapshot(self):
+        now = time.monotonic()
+        period = max(now - self.last_time, 1e-9)
+        snapshot = {
+            "messages": self.messages,
+            "routed": self.routed,
+            "messages_per_second": (self.messages - self.last_messages) / period,
+            "routed_per_second": (self.routed - self.last_routed) / period,
+            "avg_handler_ms": self.handler_time / self.routed * 1000 if self.routed else 0.0,
+            "max_handler_ms": self.slowest * 1000
+        }
+        self.last_time = now
+        self.last_messages = self.messages
+        self.last_routed = self.routed
+        self.slowest = 0.0
+        return snapshot
+
+class ChannelState:
+    # Everything one channel's vote and queue need. A bot connection holds one of these per
+    # joined channel and only shares the chat outbox, the Helix session and the subscriber
+    # cache between them.
+    def __init__(self, bot, name, vote_choices, queue_keywords, duration, journal_filename="vote_journal.jsonl", export_name="vote_results", chat_control=False):
+        self.bot = bot
+        self.name = name.lower()
+        self.channel = None
+        self.channel_id = ""
+        self.router = CommandRouter()
+        self.router.add_command("!QUEUE", self.handle_queue_command)
+        self.router.add_command("!POSITION", self.handle_position_command)
+        self.router.add_command("!VOTES", self.handle_votes_command)
+        if chat_control:
+            # Lets moderators run the channel from chat when there is no GUI
+            self.router.add_command("!STARTVOTE", self.handle_start_vote_command, takes_args=True)
+            self.router.add_command("!STOPVOTE", self.handle_stop_vote_command, takes_args=True)
+            self.router.add_command("!CLEARQUEUE", self.handle_clear_queue_command, takes_args=True)
+        self.router.add_command("!PROFILE", self.handle_profile_command, takes_args=True)
+        self._vote_choices = list(vote_choices)
+        self._queue_keywords = list(queue_keywords)
+        self.compile_routes()
+        self.votes = VoteStore()
+        self.duration = duration
+        self.update_countdown_callback = None
+        self.finish_vote_callback = None
+        self.update_queue_callback = None
+        self.vote_running = False
+        self.vote_restored = False
+        self.queue_list = ViewerQueue()
+        self.queue_priority = False  # Subscribers jump ahead of non-subscribers, higher tiers first
+        self.vote_stopped = False  # Flag to track if voting was stopped manually
+        self.scheduler = VoteScheduler(self.on_vote_tick, self.on_vote_warning, self.on_vote_close)
+        self.broadcaster_subscriptions_table = {}
+        self.subscription_refresh_task = None
+        self.load_subscriptions_snapshot()
+        self.tally = VoteTally(self.votes)
+        self.subscription_resolver = SubscriptionResolver(bot.helix, on_tier=self.on_tier)
+        self.user_ids = {}
+        self.export_name = export_name
+        self.export_format = "csv"
+        self.export_gzip = False
+        self.export_expanded = False
+        self.metrics = ChannelMetrics()
+        METRICS.read("counter", "chat_messages_total", "Chat messages received", lambda: self.metrics.messages, channel=self.name)
+        METRICS.read("counter", "chat_routed_total", "Chat messages that triggered a handler", lambda: self.metrics.routed, channel=self.name)
+        METRICS.read("gauge", "vote_participants", "Voters in the current or last vote", lambda: len(self.votes), channel=self.name)
+        METRICS.read("gauge", "queue_length", "Users in the queue", lambda: len(self.queue_list), channel=self.name)
+        self.journal = VoteJournal(journal_filename)
+        self.restore_from_journal()
+        self.journal.start()
+        atexit.register(self.journal.close)
+
+    @property
+    def vote_choices(self):
+        return self._vote_choices
+
+    @vote_choices.setter
+    def vote_choices(self, vote_choices):
+        self._vote_choices = list(vote_choices)
+        self.compile_routes()
+
+    @property
+    def queue_keywords(self):
+        return self._queue_keywords
+
+    @queue_keywords.setter
+    def queue_keywords(self, queue_keywords):
+        self._queue_keywords = list(queue_keywords)
+        self.compile_routes()
+
+    @property
+    def match_mode(self):
+        return self.router.matcher.mode
+
+    @match_mode.setter
+    def match_mode(self, mode):
+        self.router.set_match_mode(mode)
+
+    def compile_routes(self):
+        self.router.compile(
+            (self._vote_choices, self.handle_vote),
+            (self._queue_keywords, self.handle_queue)
+        )
+
+    async def setup(self, channel):
+        self.channel = channel
+        try:
+            user_res = await self.bot.helix.get_user(self.name)
+            self.channel_id = user_res["data"][0]["id"]
+        except Exception as e:
+            print(f"Cannot retrieve channel data for {self.name}", e)
+
+        if self.subscription_refresh_task is None or self.subscription_refresh_task.done():
+            self.subscription_refresh_task = asyncio.create_task(self.refresh_subscriptions())
+
+    def load_subscriptions_snapshot(self):
+        snapshot = self.bot.subscription_cache.load(self.name)
+        if snapshot is not None:
+            self.broadcaster_subscriptions_table = snapshot["subscriptions"]
+            print(f"Loaded {len(snapshot['subscriptions'])} subscribers from cache")
+
+    async def fetch_subscriptions(self, page_retries=5):
+        # A page that still fails after the request's own retries is tried again from the
+        # same cursor, so one bad page does not throw away the pages already fetched
+        table = {}
+        cursor = None
+        failures = 0
+        while True:
+            try:
+                broadcaster_sub_res = await self.bot.helix.get_broadcaster_subscriptions(self.channel_id, cursor)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                failures += 1
+                if failures > page_retries:
+                    raise
+                print(f"Subscriber page failed, retrying ({failures}/{page_retries})", e)
+                await asyncio.sleep(min(2 ** failures, 30))
+                continue
+            failures = 0
+            for sub in broadcaster_sub_res["data"]:
+                table[sub["user_login"]] = SubscriptionRecord(sub["tier"])
+            cursor = broadcaster_sub_res["pagination"].get("cursor")
+            if not cursor:
+                return table
+
+    async def refresh_subscriptions(self):
+        if not self.channel_id or not self.bot.subscription_cache.is_stale(self.name):
+            return
+        try:
+            fresh = await self.fetch_subscriptions()
+        except Exception as e:
+            print("Cannot retrieve your channel subscribers data", e)
+            return
+
+        # Helix has no "changed since" query, so the crawl is full but it runs in the
+        # background; the live table is swapped in one assignment and only rewritten
+        # on disk when something actually changed.
+        added, removed, changed = SubscriberCache.diff(self.broadcaster_subscriptions_table, fresh)
+        self.broadcaster_subscriptions_table = fresh
+        if added or removed or changed:
+            print(f"Subscribers updated: +{len(added)} -{len(removed)} ~{len(changed)}")
+            await asyncio.to_thread(self.bot.subscription_cache.save, self.name, fresh)
+        else:
+            self.bot.subscription_cache.touch(self.name)
+
+    def restore_from_journal(self):
+        state = self.journal.restore()
+        for user, priority in state.queue.items():
+            self.queue_list.append(user, priority)
+        if state.vote_open and state.votes:
+            self._vote_choices = list(state.choices)
+            self.compile_routes()
+            if state.weights:
+                self.tally.tier_weights = dict(state.weights)
+            self.tally.reset(state.choices)
+            for user, choice, tier in state.votes.entries():
+                self.tally.add(user, choice, tier)
+                self.subscription_resolver.tiers[user] = tier
+            self.vote_restored = True
+            print(f"🔄 Restored {len(state.votes)} votes from an unfinished vote in {self.name}, press Stop Vote to finish it")
+        if state.queue:
+            print(f"🔄 Restored {len(state.queue)} users in queue for {self.name}")
+
+    def on_tier(self, user, tier):
+        if self.tally.get_tier(user) not in (None, tier):
+            self.tally.retier(user, tier)
+            self.journal.record("tier", user=user, tier=tier)
+
+    async def handle_vote(self, message, content):
+        # โหวต: บันทึกการโหวตเฉพาะเมื่อโหวตระหว่างที่กำลังรันโหวต
+        if not self.vote_running or not self.scheduler.accepts(message.tags):
+            return
+        user = message.author.name
+        if user not in self.votes:
+            self.record_tier(user, get_tier_from_tags(message.tags), message.author.id)
+            self.tally.add(user, content, self.get_subscription(user))
+            self.journal.record("vote", user=user, choice=content, tier=self.tally.get_tier(user))
+            self.bot.outbox.acknowledge(message.channel, f"เลือก {content} แล้ว", "{user} เลือก " + content + " แล้ว!", user)
+
+    async def handle_queue(self, message, content):
+        # คิว: เพิ่มหรือเอาผู้ใช้จากคิว
+        user = message.author.name
+        if user not in self.queue_list:
+            self.record_tier(user, get_tier_from_tags(message.tags), message.author.id)
+            priority = self.get_queue_priority(user)
+            self.queue_list.append(user, priority)
+            self.journal.record("queue_join", user=user, priority=priority)
+            self.bot.ui_call(self.update_queue_callback, self.queue_list)
+            self.bot.outbox.acknowledge(message.channel, "เข้าคิวแล้ว", "{user} เข้าคิวแล้ว!", user)  # ส่งข้อความว่าเข้าคิวแล้ว
+        else:
+            self.bot.outbox.acknowledge(message.channel, "ไปต่อแถวใหม่ไป๊!", "{user} ไปต่อแถวใหม่ไป๊!.", user)  # แจ้งว่าผู้ใช้ในคิวแล้ว
+
+    async def handle_queue_command(self, message, content):
+        if self.queue_list:
+            queue_message = "รายชื่อในคิว:\n" + "\n".join(f"{idx+1}. {user}" for idx, user in enumerate(self.queue_list[:5]))
+        else:
+            queue_message = "คิวว่างไม่มีใครอยากเล่นด้วย ว๊ายๆๆ😂"
+        self.bot.outbox.announce(message.channel, queue_message)
+
+    async def handle_votes_command(self, message, content):
+        if self.tally.total:
+            self.bot.outbox.announce(message.channel, f"📊 {self.tally.format_standings()}")
+
+    async def handle_position_command(self, message, content):
+        user = message.author.name
+        position = self.queue_list.position(user)
+        if position is None:
+            self.bot.outbox.acknowledge(message.channel, "ยังไม่ได้เข้าคิว", "{user} ยังไม่ได้เข้าคิว", user)
+        else:
+            self.bot.outbox.acknowledge(message.channel, "ลำดับคิว", "ลำดับคิว: {user}", f"{user} #{position}/{len(self.queue_list)}")
+
+    async def handle_start_vote_command(self, message, content):
+        # !STARTVOTE A,B,C 60
+        if not is_moderator(message.author):
+            return
+        parts = content.split()
+        try:
+            choices = [choice for choice in parts[1].split(",") if choice]
+            duration = int(parts[2]) if len(parts) > 2 else self.duration
+        except (IndexError, ValueError):
+            choices, duration = [], 0
+        if not choices or duration <= 0:
+            self.bot.outbox.announce(message.channel, "วิธีใช้: !STARTVOTE A,B,C 60")
+            return
+        if self.vote_running:
+            self.bot.outbox.announce(message.channel, "⚠️ กำลังโหวตอยู่ ใช้ !STOPVOTE ก่อน")
+            return
+        self.start_vote(choices, duration)
+
+    async def handle_stop_vote_command(self, message, content):
+        if is_moderator(message.author):
+            self.stop_vote_now()
+
+    async def handle_clear_queue_command(self, message, content):
+        if is_moderator(message.author):
+            self.clear_queue()
+            self.bot.ui_call(self.update_queue_callback, self.queue_list)
+            self.bot.outbox.announce(message.channel, "🧹 ล้างคิวแล้ว")
+
+    async def handle_profile_command(self, message, content):
+        # !PROFILE [seconds] starts a profiling window, !PROFILE STOP ends it early
+        if not is_moderator(message.author):
+            return
+        parts = content.split()
+        argument = parts[1] if len(parts) > 1 else ""
+        if argument == "STOP":
+            duration = 0
+        elif argument.isdigit() and int(argument) > 0:
+            duration = int(argument)
+        else:
+            duration = 60
+        if self.profile(duration):
+            self.bot.outbox.announce(message.channel, f"🔬 เริ่มโปรไฟล์ {duration} วินาที" if duration else "🔬 หยุดโปรไฟล์แล้ว")
+
+    def profile(self, duration):
+        # duration 0 stops the running profile
+        if duration:
+            return self.bot.profiler.start(duration)
+        return self.bot.profiler.stop()
+
+    def get_queue_priority(self, user):
+        if not self.queue_priority:
+            return 0
+        # Lanes are served highest priority first, so Tier 3 (3000) goes ahead of non-subscribers (0)
+        return int(self.get_subscription(user))
+
+    def record_tier(self, user, tier, user_id):
+        # Tags are current for every message, so they also catch users who subscribed mid-stream;
+        # Helix is only asked about users whose message came without badge tags
+        if tier is not None:
+            self.subscription_resolver.remember(user, tier)
+        else:
+            self.user_ids[user] = user_id
+            self.subscription_resolver.queue(self.channel_id, user, user_id)
+
+    def start_vote(self, vote_choices, duration):
+        # Runs on the event loop; used when the channel is driven without the GUI
+        self.vote_choices = [choice.upper() for choice in vote_choices]
+        self.duration = duration
+        self.begin_vote()
+        self.announce(f"🚨 เริ่มโหวตแล้ว! พิมพ์ {', '.join(self.vote_choices)} เพื่อเลือก มีเวลา {self.duration} วินาที!")
+
+    def set_queue_keywords(self, queue_keywords):
+        self.queue_keywords = [keyword.upper() for keyword in queue_keywords]
+
+    def begin_vote(self):
+        self.tally.reset(self.vote_choices)
+        self.vote_restored = False
+        self.vote_stopped = False
+        self.journal.record("vote_start", choices=self.vote_choices, weights=dict(self.tally.tier_weights))
+        self.vote_running = True
+        self.scheduler.start(self.duration)
+
+    def on_vote_tick(self, time_left):
+        self.bot.ui_call(self.update_countdown_callback, time_left)
+
+    def on_vote_warning(self):
+        self.announce("⏳ เหลือเวลา 10 วินาที!")
+
+    async def on_vote_close(self, stopped):
+        self.vote_running = False
+        if stopped:
+            self.announce("⏹️ โหวตถูกหยุดแล้ว!")
+        else:
+            self.announce("หมดเวลาโหวตแล้ว!")  # ส่งข้อความ "หมดเวลาโหวตแล้ว!" ถ้ายังไม่ได้กด stop vote
+        await self.finish_vote()
+
+    async def finish_vote(self, timeout=10):
+        # Wait only for the few subscription batches still unresolved
+        if isinstance(self.bot.helix, AsyncTwitchAPI) and self.channel_id:
+            users = {user: self.user_ids[user] for user in self.votes.users if user in self.user_ids}
+            try:
+                await asyncio.wait_for(self.subscription_resolver.resolve(self.channel_id, users), timeout)
+            except Exception as e:
+                print("Cannot resolve voter subscriptions", e)
+        self.bot.ui_call(self.finish_vote_callback, self.votes.columns())  # ส่งผลโหวตไปที่ finish_vote_callback
+        # Files are written by the journal thread from the journal's own copy of the vote
+        self.journal.record("vote_end")
+        self.journal.submit(lambda state: self.save_results_to_file(state.iter_vote_entries()))
+        if self.tally.total:
+            self.announce(f"📊 ผลโหวต: {self.tally.format_standings()}")
+        # Votes stay in the store for draws until the next vote starts
+        self.vote_restored = False
+
+    def announce(self, message):
+        if self.channel is not None:
+            self.bot.outbox.announce(self.channel, message)
+
+    def send_twitch_message(self, message):
+        if self.channel is not None:
+            self.bot.loop.call_soon_threadsafe(self.announce, message)
+        else:
+            print("Cannot send a message because channel has not been connected yet!")
+
+    def save_results_to_file(self, result):
+        if self.export_expanded:
+            result = list(result)
+            self.save_expanded_results_to_file(result)
+        file_path = write_vote_export(iter_vote_rows(result, self.tally.get_weight), self.export_name, self.export_format, self.export_gzip)
+        print(f"Results saved to {file_path}")
+
+    def save_expanded_results_to_file(self, result):
+        # Legacy files: subscribers are written twice instead of having a weight column
+        # This file generate user, choice, subscription sort by time
+        file_path = f"{self.export_name}.txt"
+        group_by_choice = {}
+        with open(file_path, "w", encoding="utf-8") as file:
+            for user, choice, tier in result:  # รับผลโหวตในรูปแบบ tuple
+                match tier:
+                    case "1000":
+                        subscription = "T1"
+                    case "2000":
+                        subscription = "T2"
+                    case "3000":
+                        subscription = "T3"
+                    case _:
+                        subscription = "None"
+                file.write(f"{user},{choice},{subscription}\n")
+                users = group_by_choice.setdefault(choice, [])
+                users.append(user)
+                if subscription != "None":
+                    file.write(f"{user},{choice},{subscription}\n")
+                    users.append(user)
+        print(f"Results saved to {file_path}")
+
+        # This file generate only username group by choice
+        file_path = f"{self.export_name}_choice_seperated.txt"
+        with open(file_path, "w", encoding="utf-8") as file:
+            for choice, users in group_by_choice.items():
+                file.write(f"------------- Choice: {choice} -------------\n")
+                file.write('\n'.join(users))
+                file.write('\n')
+
+        print(f"Results saved to {file_path}")
+
+    def stop_vote_now(self):
+        if self.vote_stopped or not (self.vote_running or self.vote_restored):
+            return
+        self.vote_stopped = True  # Set flag to true when vote is manually stopped
+        self.scheduler.cancel()
+        asyncio.create_task(self.on_vote_close(stopped=True))
+
+    def draw_winners(self, pool, count, replace=False, seed=None):
+        # pool is a vote choice or "QUEUE"; the seed is announced so the draw can be repeated
+        if pool == "QUEUE":
+            users = list(self.queue_list)
+            weights = [self.tally.get_weight(self.get_subscription(user)) for user in users]
+        else:
+            users = list(self.votes.iter_voters(pool))
+            weights = [self.tally.get_weight(self.tally.get_tier(user)) for user in users]
+        if seed is None:
+            seed = random.randrange(1_000_000)
+        winners = AliasTable(users, weights, random.Random(seed)).sample(count, replace)
+        self.send_twitch_message(f"🎉 ผู้โชคดี ({pool}): {', '.join(winners)} (seed {seed})")
+        return winners, seed
+
+    def remove_from_queue(self, users):
+        self.queue_list.remove_many(users)
+        self.journal.record("queue_remove", users=list(users))
+
+    def clear_queue(self):
+        self.queue_list.clear()
+        self.journal.record("queue_clear")
+
+    def get_subscription(self, user):
+        tier = self.subscription_resolver.get(user)
+        if tier is not None:
+            return tier
+        if user in self.broadcaster_subscriptions_table:
+            return self.broadcaster_subscriptions_table[user].tier
+        return "0000"
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats["channel"] = self.name
+        stats["votes"] = len(self.votes)
+        stats["queue"] = len(self.queue_list)
+        return stats
+
+class PrimaryChannelAttribute:
+    # Keeps the single-channel attribute names working on the bot by forwarding them to
+    # its first channel, which is the one the GUI drives
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, bot, owner=None):
+        if bot is None:
+            return self
+        return getattr(bot.primary, self.name)
+
+    def __set__(self, bot, value):
+        setattr(bot.primary, self.name, value)
+
+class TwitchVoteBot(commands.Bot):
+    votes = PrimaryChannelAttribute()
+    tally = PrimaryChannelAttribute()
+    queue_list = PrimaryChannelAttribute()
+    queue_priority = PrimaryChannelAttribute()
+    vote_running = PrimaryChannelAttribute()
+    vote_restored = PrimaryChannelAttribute()
+    vote_stopped = PrimaryChannelAttribute()
+    vote_choices = PrimaryChannelAttribute()
+    queue_keywords = PrimaryChannelAttribute()
+    match_mode = PrimaryChannelAttribute()
+    duration = PrimaryChannelAttribute()
+    export_format = PrimaryChannelAttribute()
+    export_gzip = PrimaryChannelAttribute()
+    export_expanded = PrimaryChannelAttribute()
+    channel_id = PrimaryChannelAttribute()
+    scheduler = PrimaryChannelAttribute()
+    journal = PrimaryChannelAttribute()
+    subscription_resolver = PrimaryChannelAttribute()
+    broadcaster_subscriptions_table = PrimaryChannelAttribute()
+
+    def __init__(self, token, channel, vote_choices, queue_keywords, duration, root, update_countdown_callback, finish_vote_callback, update_queue_callback,twitch_api, per_channel_files=None, chat_control=False, metrics_port=None, metrics_summary_interval=60):
+        # channel is a channel name or a list of them; with several channels every channel
+        # gets its own journal and export files
+        names = [channel] if isinstance(channel, str) else list(channel)
+        super().__init__(
+            token=token,
+            prefix='!',
+            initial_channels=names
+        )
+        use_chat_endpoints(self)
+        self.root = root
+        self.helix = twitch_api
+        self.subscription_cache = SubscriberCache()
+        self.outbox = ChatOutbox()
+        self.metrics_port = metrics_port
+        self.metrics_summary_interval = metrics_summary_interval
+        self.message_latency = METRICS.histogram("chat_message_seconds", "Time from receiving a message to finishing with it")
+        self.route_latency = METRICS.histogram("chat_route_seconds", "Time to decide what a message triggers")
+        self.handler_latency = {}
+        self.profile_callback = None
+        self.recorder = None  # chat_capture.ChatRecorder, when traffic is being recorded
+        self.profiler = PROFILER
+        self.profile_listener = lambda running: self.ui_call(self.profile_callback, running)
+        self.profiler.add_listener(self.profile_listener)
+        if per_channel_files is None:
+            per_channel_files = len(names) > 1
+        self.channels = {}
+        for name in names:
+            if per_channel_files:
+                state = ChannelState(self, name, vote_choices, queue_keywords, duration, f"vote_journal_{name.lower()}.jsonl", f"vote_results_{name.lower()}", chat_control)
+            else:
+                state = ChannelState(self, name, vote_choices, queue_keywords, duration, chat_control=chat_control)
+            self.channels[state.name] = state
+        self.primary = self.channels[names[0].lower()]
+        self.primary.update_countdown_callback = update_countdown_callback
+        self.primary.finish_vote_callback = finish_vote_callback
+        self.primary.update_queue_callback = update_queue_callback
+        METRICS.read("gauge", "chat_outbox_depth", "Messages and acknowledgements waiting to be sent", self.outbox.depth, connection=self.primary.name)
+
+    async def event_ready(self):
+
+        if self.connected_channels:
+            await asyncio.gather(*(self.channels[channel.name.lower()].setup(channel)
+                                   for channel in self.connected_channels if channel.name.lower() in self.channels))
+
+            # Broadcaster and moderators may send 100 messages per 30 seconds, everyone else 20
+            if len(self.channels) == 1 and self.nick.lower() == self.primary.name:
+                self.outbox.set_limits(100, 30)
+            self.outbox.start()
+            METRICS.start(self.metrics_port, self.metrics_summary_interval)
+            self.primary.announce(f"🔐 คอมพี่มาสถูกล็อคเเล้ว กรุณาติดต่อเพื่อปลดล็อค!")
+            print(f"✅ Ready to go! Logged in as | {self.nick} ({', '.join(channel.name for channel in self.connected_channels)})")
+        else:
+            print("Channel has not been connected yet!")
+
+    async def close(self):
+        self.profiler.remove_listener(self.profile_listener)
+        if not self.profiler.listeners:
+            self.profiler.stop()  # The last bot in this process is going away
+        if self.recorder is not None:
+            self.recorder.close()
+        for state in self.channels.values():
+            state.journal.close()
+        if self.outbox.task:
+            self.outbox.task.cancel()
+        if isinstance(self.helix, AsyncTwitchAPI):
+            await self.helix.close()
+        await super().close()
+
+    async def event_message(self, message):
+        if message.echo:
+            return
+        received = time.perf_counter()
+        if self.recorder is not None:
+            self.recorder.record(message)
+        state = self.channels.get(message.channel.name)
+        if state is None:
+            return
+        state.metrics.messages += 1
+        state.scheduler.observe(message.tags)  # Every message sharpens the server clock estimate
+        content = message.content.strip().upper()
+        token, handlers = state.router.route(content)
+        started = time.perf_counter()
+        self.route_latency.observe(started - received)
+        if handlers is None:
+            self.message_latency.observe(started - received)
+            return
+        for handler in handlers:
+            handler_started = time.perf_counter()
+            await handler(message, token)
+            self.get_handler_latency(handler).observe(time.perf_counter() - handler_started)
+        finished = time.perf_counter()
+        state.metrics.record(finished - started)
+        self.message_latency.observe(finished - received)
+
+    def get_handler_latency(self, handler):
+        histogram = self.handler_latency.get(handler.__name__)
+        if histogram is None:
+            histogram = self.handler_latency[handler.__name__] = METRICS.histogram(
+                "chat_handler_seconds", "Time spent in one message handler", handler=handler.__name__.removeprefix("handle_"))
+        return histogram
+
+    def ui_call(self, callback, *args):
+        # Hands a UI callback over to the Tk thread; channels without a UI have no callbacks
+        if callback is None:
+            return
+        if self.root is not None:
+            self.root.after(0, callback, *args)
+        else:
+            callback(*args)
+
+    def start_countdown(self):
+        # Called from the Tk thread; the vote itself is run on the bot's event loop
+        self.loop.call_soon_threadsafe(self.primary.begin_vote)
+
+    def stop_vote(self):
+        self.loop.call_soon_threadsafe(self.primary.stop_vote_now)
+
+    def send_twitch_message(self, message):
+        self.primary.send_twitch_message(message)
+
+    def draw_winners(self, pool, count, replace=False, seed=None):
+        return self.primary.draw_winners(pool, count, replace, seed)
+
+    def remove_from_queue(self, users):
+        self.primary.remove_from_queue(users)
+
+    def clear_queue(self):
+        self.primary.clear_queue()
+
+    def get_subscription(self, user):
+        return self.primary.get_subscription(user)
+
+    def stats(self):
+        outbox_depth = self.outbox.depth()
+        rows = []
+        for state in self.channels.values():
+            row = state.stats()
+            row["outbox_depth"] = outbox_depth
+            rows.append(row)
+        return rows
+
+def plan_shards(channels, shard_count, load=None):
+    # Longest-processing-time first: the busiest channels are placed first, each on the
+    # shard with the least expected load so far. Unknown channels count as load 1.
+    load = load or {}
+    shards = [[] for _ in range(max(1, min(shard_count, len(channels))))]
+    totals = [0.0] * len(shards)
+    for name in sorted(channels, key=lambda name: load.get(name, 1), reverse=True):
+        idx = totals.index(min(totals))
+        shards[idx].append(name)
+        totals[idx] += load.get(name, 1)
+    return shards
+
+def format_channel_stats(rows):
+    lines = [f"📈 {'channel':<25}{'msg/s':>8}{'routed/s':>10}{'avg ms':>8}{'max ms':>8}{'votes':>8}{'queue':>7}{'outbox':>8}"]
+    for row in sorted(rows, key=lambda row: row["messages_per_second"], reverse=True):
+        lines.append(f"   {row['channel']:<25}{row['messages_per_second']:>8.1f}{row['routed_per_second']:>10.1f}"
+                     f"{row['avg_handler_ms']:>8.2f}{row['max_handler_ms']:>8.2f}{row['votes']:>8}{row['queue']:>7}{row['outbox_depth']:>8}")
+    return "\n".join(lines)
+
+# Channel methods a runtime command may call
+SHARD_COMMANDS = ("start_vote", "stop_vote_now", "set_queue_keywords", "clear_queue", "draw_winners", "profile")
+
+async def report_shard_stats(bots, interval, reports):
+    while True:
+        await asyncio.sleep(interval)
+        reports.put([row for bot in bots for row in bot.stats()])
+
+async def serve_shard(config, commands, reports):
+    # One worker: its channels are split over connections of at most channels_per_connection
+    # channels each, all running on this worker's event loop
+    channels = config["channels"]
+    connections = math.ceil(len(channels) / config["channels_per_connection"])
+    bots = []
+    for group in plan_shards(channels, connections, config["load"]):
+        helix = AsyncTwitchAPI(client_id=config["client_id"], client_secret=config["client_secret"], access_token=config["token"])
+        bots.append(TwitchVoteBot(config["token"], group, config["vote_choices"], config["queue_keywords"], config["duration"],
+                                  None, None, None, None, helix, per_channel_files=True, chat_control=config["chat_control"],
+                                  metrics_port=config["metrics_port"], metrics_summary_interval=config["metrics_summary_interval"]))
+    if config["record"]:
+        from chat_capture import ChatRecorder
+        for bot in bots:
+            # One capture per connection unless the whole runtime is a single connection
+            path = config["record"]
+            if config["record_per_connection"]:
+                root, ext = os.path.splitext(path)
+                path = f"{root}_{bot.primary.name}{ext}"
+            bot.recorder = ChatRecorder(path)
+    states = {name: state for bot in bots for name, state in bot.channels.items()}
+    tasks = [asyncio.create_task(bot.start()) for bot in bots]
+    tasks.append(asyncio.create_task(report_shard_stats(bots, config["report_interval"], reports)))
+    try:
+        while True:
+            command = await asyncio.to_thread(commands.get)
+            if command is None:
+                break
+            name, channel, args = command
+            if name not in SHARD_COMMANDS or channel not in states:
+                print(f"Unknown command {name} for {channel}")
+                continue
+            try:
+                getattr(states[channel], name)(*args)
+            except Exception as e:
+                print(f"Command {name} failed for {channel}", e)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for bot in bots:
+            await bot.close()
+
+def run_shard(config, commands, reports):
+    asyncio.run(serve_shard(config, commands, reports))
+
+class ShardedRuntime:
+    # Serves many channels from one host. Channels are spread over worker processes (or a
+    # single worker thread when processes is 1) and, inside a worker, over several IRC
+    # connections, so a busy chat only competes with the few channels sharing its
+    # connection. Workers take commands through a queue and report per-channel stats back.
+    def __init__(self, token, channels, vote_choices=(), queue_keywords=(), duration=0, client_id="", client_secret="",
+                 channels_per_connection=20, processes=1, load=None, report_interval=30, chat_control=False,
+                 metrics_port=None, metrics_summary_interval=60, record=None):
+        self.config = {
+            "token": token,
+            "channels": [channel.lower() for channel in channels],
+            "vote_choices": list(vote_choices),
+            "queue_keywords": list(queue_keywords),
+            "duration": duration,
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "channels_per_connection": max(1, channels_per_connection),
+            "load": {channel.lower(): value for channel, value in (load or {}).items()},
+            "report_interval": report_interval,
+            "chat_control": chat_control,
+            "metrics_port": metrics_port,
+            "metrics_summary_interval": metrics_summary_interval,
+            "record": record,
+            "record_per_connection": processes > 1 or len(channels) > channels_per_connection
+        }
+        self.processes = max(1, processes)
+        self.workers = []
+        self.commands = {}
+        self.reports = None
+        self.stats = {}
+
+    def start(self):
+        parallel = self.processes > 1
+        self.reports = multiprocessing.Queue() if parallel else queue.Queue()
+        for idx, group in enumerate(plan_shards(self.config["channels"], self.processes, self.config["load"])):
+            config = dict(self.config, channels=group)
+            if parallel and config["metrics_port"]:
+                config["metrics_port"] += idx  # Every process has its own metrics
+            commands = multiprocessing.Queue() if parallel else queue.Queue()
+            worker_class = multiprocessing.Process if parallel else threading.Thread
+            worker = worker_class(target=run_shard, args=(config, commands, self.reports), daemon=True)
+            worker.start()
+            self.workers.append((worker, commands))
+            for channel in group:
+                self.commands[channel] = commands
+
+    def send(self, channel, command, *args):
+        channel = channel.lower()
+        if channel not in self.commands:
+            raise Exception(f"Channel {channel} is not served by this runtime")
+        self.commands[channel].put((command, channel, args))
+
+    def poll_stats(self, timeout=None):
+        # Collects the latest report from every worker; returns the channels that reported
+        try:
+            rows = self.reports.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        for row in rows:
+            self.stats[row["channel"]] = row
+        return rows
+
+    def watch(self):
+        while any(worker.is_alive() for worker, _ in self.workers):
+            if self.poll_stats(timeout=1):
+                print(format_channel_stats(self.stats.values()))
+
+    def stop(self):
+        for _, commands in self.workers:
+            commands.put(None)
+        for worker, _ in self.workers:
+            worker.join()
+        self.workers = []
+        self.commands = {}
+
+CONTROL_USAGE = """commands:
+  start <channel> <A,B,C> <seconds>   start a vote
+  stop <channel>                      stop the running vote
+  keywords <channel> <K1,K2>          set queue keywords
+  clear <channel>                     clear the queue
+  draw <channel> <pool> [count] [seed] draw winners from QUEUE or a choice
+  profile <channel> [seconds|stop]    profile the worker serving the channel
+  stats                               per-channel throughput
+  shutdown                            stop the daemon"""
+
+def parse_control_command(line):
+    # Returns (command, channel, args) for ShardedRuntime.send, or a daemon command with no channel
+    parts = line.split()
+    if not parts:
+        raise ValueError("empty command")
+    name, args = parts[0].lower(), parts[1:]
+    if name in ("stats", "shutdown", "help") and not args:
+        return name, None, ()
+    if not args:
+        raise ValueError(f"{name} needs a channel")
+    channel, args = args[0].lower(), args[1:]
+    if name == "start" and len(args) == 2:
+        return "start_vote", channel, ([choice for choice in args[0].upper().split(",") if choice], int(args[1]))
+    if name == "stop" and not args:
+        return "stop_vote_now", channel, ()
+    if name == "keywords" and len(args) == 1:
+        return "set_queue_keywords", channel, ([keyword for keyword in args[0].upper().split(",") if keyword],)
+    if name == "clear" and not args:
+        return "clear_queue", channel, ()
+    if name == "draw" and 1 <= len(args) <= 3:
+        return "draw_winners", channel, (args[0].upper(), int(args[1]) if len(args) > 1 else 1, False, int(args[2]) if len(args) > 2 else None)
+    if name == "profile" and len(args) <= 1:
+        return "profile", channel, (0 if args and args[0].lower() == "stop" else int(args[0]) if args else 60,)
+    raise ValueError(f"unknown command: {line.strip()}")
+
+class HeadlessDaemon:
+    # Runs a ShardedRuntime without any GUI. It is controlled from stdin when attached to a
+    # terminal, from a line-based control socket on localhost, and by moderators in chat.
+    def __init__(self, runtime, control_port=8765, interactive=None):
+        self.runtime = runtime
+        self.control_port = control_port
+        self.interactive = sys.stdin.isatty() if interactive is None else interactive
+        self.stopped = None
+        self.clients = {}  # handle_client task -> its writer
+
+    def execute(self, line):
+        try:
+            command, channel, args = parse_control_command(line)
+        except ValueError as e:
+            return f"error: {e}"
+        if command == "help":
+            return CONTROL_USAGE
+        if command == "stats":
+            return format_channel_stats(self.runtime.stats.values()) if self.runtime.stats else "no stats yet"
+        if command == "shutdown":
+            self.stopped.set()
+            return "ok"
+        try:
+            self.runtime.send(channel, command, *args)
+        except Exception as e:
+            return f"error: {e}"
+        return "ok"
+
+    async def handle_client(self, reader, writer):
+        self.clients[asyncio.current_task()] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write((self.execute(line.decode("utf-8", "replace")) + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(asyncio.current_task(), None)
+            writer.close()
+
+    def read_stdin_lines(self, loop, lines):
+        # Runs on a daemon thread so a readline blocked on the terminal never holds up shutdown
+        try:
+            for line in iter(sys.stdin.readline, ""):
+                loop.call_soon_threadsafe(lines.put_nowait, line)
+            loop.call_soon_threadsafe(lines.put_nowait, None)
+        except RuntimeError:
+            pass  # The loop is gone
+
+    async def read_stdin(self):
+        lines = asyncio.Queue()
+        threading.Thread(target=self.read_stdin_lines, args=(asyncio.get_running_loop(), lines), daemon=True).start()
+        while (line := await lines.get()) is not None:
+            if line.strip():
+                print(self.execute(line))
+
+    async def watch_workers(self):
+        while not self.stopped.is_set():
+            if not any(worker.is_alive() for worker, _ in self.runtime.workers):
+                print("All workers have stopped")
+                self.stopped.set()
+                return
+            if await asyncio.to_thread(self.runtime.poll_stats, 1):
+                print(format_channel_stats(self.runtime.stats.values()))
+
+    async def serve(self):
+        self.stopped = asyncio.Event()
+        server = None
+        if self.control_port:
+            server = await asyncio.start_server(self.handle_client, "127.0.0.1", self.control_port)
+            print(f"🛰️ Control socket on 127.0.0.1:{self.control_port}")
+        tasks = [asyncio.create_task(self.watch_workers())]
+        if self.interactive:
+            print(CONTROL_USAGE)
+            tasks.append(asyncio.create_task(self.read_stdin()))
+        try:
+            await self.stopped.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if server is not None:
+                server.close()
+                # Closing a client's writer ends its readline, so the handlers finish on their own
+                for writer in self.clients.values():
+                    writer.close()
+                if self.clients:
+                    await asyncio.wait(list(self.clients), timeout=5)
+                await server.wait_closed()
+
+    def run(self):
+        self.runtime.start()
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.runtime.stop()
+
+def send_control_command(line, port=8765, host="127.0.0.1"):
+    with socket.create_connection((host, port), timeout=5) as sock:
+        sock.sendall(line.strip().encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        reply = b""
+        while chunk := sock.recv(4096):
+            reply += chunk
+    return reply.decode("utf-8").rstrip("\n")
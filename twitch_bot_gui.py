@@ -0,0 +1,650 @@
+import tkinter as tk
+from tkinter import messagebox
+from tkinter import ttk
+import asyncio
+import threading
+import webbrowser
+import queue
+import os
+
+from twitch_bot_core import AsyncTwitchAuth, TwitchAPI, AsyncTwitchAPI, TwitchVoteBot, KeywordMatcher, VoteTally, VoteStore
+
+class TableRenderer:
+    # Model changes are posted here from any thread and drained on the Tk thread at a fixed
+    # frame rate. Only the newest snapshot per table is drawn and only rows that changed are
+    # touched, so a burst of joins becomes a handful of small repaints. Tables registered with
+    # a read function are only marked dirty on change and read once per frame.
+    def __init__(self, root, fps=10):
+        self.root = root
+        self.interval = max(1, int(1000 / fps))
+        self.updates = queue.Queue()
+        self.dirty = set()
+        self.tables = {}
+        self.root.after(self.interval, self.flush)
+
+    def register(self, name, table, build_rows, read=None):
+        # read returns the model, or None when it will be submit()ted later instead
+        self.tables[name] = {"table": table, "build_rows": build_rows, "read": read, "rows": [], "iids": []}
+
+    def submit(self, name, model):
+        self.updates.put((name, model))
+
+    def mark(self, name):
+        self.dirty.add(name)
+
+    def flush(self):
+        latest = {}
+        while True:
+            try:
+                name, model = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            latest[name] = model
+        while self.dirty:
+            name = self.dirty.pop()
+            model = self.tables[name]["read"]()
+            if model is not None:
+                latest[name] = model
+        for name, model in latest.items():
+            self.apply(self.tables[name], model)
+        self.root.after(self.interval, self.flush)
+
+    def apply(self, state, model):
+        table, rendered, iids = state["table"], state["rows"], state["iids"]
+        rows = state["build_rows"](model)
+        for idx in range(min(len(rows), len(rendered))):
+            if rows[idx] != rendered[idx]:
+                table.item(iids[idx], values=rows[idx])
+        if len(rows) > len(rendered):
+            for row in rows[len(rendered):]:
+                iids.append(table.insert("", "end", values=row))
+        elif len(rows) < len(rendered):
+            table.delete(*iids[len(rows):])
+            del iids[len(rows):]
+        state["rows"] = rows
+
+TIER_LABELS = {"1000": "Tier 1", "2000": "Tier 2", "3000": "Tier 3", "0000": "-"}
+
+class VirtualTable:
+    # Result viewer for votes of any size. It reads the VoteStore's own columns (users,
+    # choice_of, tier_of), filters and sorts a list of voter ids, and only builds row tuples and
+    # Treeview items for the rows that fit on screen.
+    ALL = "All"
+
+    def __init__(self, parent, renderer, name, height=15):
+        self.renderer = renderer
+        self.name = name
+        self.height = height
+        self.users = []
+        self.choice_of = []
+        self.tier_of = b""
+        self.choices = []
+        self.view = []
+        self.offset = 0
+        self.sort_column = None
+        self.sort_reverse = False
+
+        self.frame = tk.Frame(parent, bg="#2e2e2e")
+        filter_frame = tk.Frame(self.frame, bg="#2e2e2e")
+        filter_frame.pack(fill="x", pady=(0, 5))
+        tk.Label(filter_frame, text="Choice:", fg="white", bg="#2e2e2e").pack(side="left")
+        self.choice_filter = tk.StringVar(value=self.ALL)
+        self.choice_menu = ttk.Combobox(filter_frame, textvariable=self.choice_filter, values=[self.ALL], state="readonly", width=15)
+        self.choice_menu.pack(side="left", padx=5)
+        self.choice_menu.bind("<<ComboboxSelected>>", lambda event: self.refresh_view())
+        tk.Label(filter_frame, text="Subscription:", fg="white", bg="#2e2e2e").pack(side="left")
+        self.tier_filter = tk.StringVar(value=self.ALL)
+        self.tier_menu = ttk.Combobox(filter_frame, textvariable=self.tier_filter, values=[self.ALL, *TIER_LABELS.values()], state="readonly", width=8)
+        self.tier_menu.pack(side="left", padx=5)
+        self.tier_menu.bind("<<ComboboxSelected>>", lambda event: self.refresh_view())
+        self.count_label = tk.Label(filter_frame, text="0 / 0", fg="white", bg="#2e2e2e")
+        self.count_label.pack(side="right")
+
+        table_frame = tk.Frame(self.frame, bg="#2e2e2e")
+        table_frame.pack()
+        self.table = ttk.Treeview(table_frame, columns=("No", "Username", "Subscription", "Choice"), show="headings", height=height)
+        # Heading
+        self.table.heading("No", text="No.", command=lambda: self.sort_by(None))
+        self.table.heading("Username", text="Username", command=lambda: self.sort_by(0))
+        self.table.heading("Subscription", text="Subscription", command=lambda: self.sort_by(1))
+        self.table.heading("Choice", text="Choice", command=lambda: self.sort_by(2))
+        # Column
+        self.table.column("No", width=50, anchor="center")
+        self.table.column("Username", width=150)
+        self.table.column("Subscription", width=80, anchor="center")
+        self.table.column("Choice", width=150)
+        self.table.pack(side="left")
+        self.scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.table.bind("<MouseWheel>", self.on_mousewheel)
+        self.table.bind("<Button-4>", lambda event: self.scroll_to(self.offset - 3))
+        self.table.bind("<Button-5>", lambda event: self.scroll_to(self.offset + 3))
+
+        renderer.register(name, self.table, self.build_visible_rows)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def set_votes(self, users, choice_of, tier_of, choices):
+        self.users, self.choice_of, self.tier_of, self.choices = users, choice_of, tier_of, choices
+        self.choice_menu.config(values=[self.ALL, *sorted(choices)])
+        if self.choice_filter.get() not in choices:
+            self.choice_filter.set(self.ALL)
+        self.offset = 0
+        self.refresh_view()
+
+    def clear(self):
+        self.set_votes([], [], b"", [])
+
+    def refresh_view(self):
+        choice = self.choice_filter.get()
+        tier = self.tier_filter.get()
+        users, choice_of, tier_of, choices = self.users, self.choice_of, self.tier_of, self.choices
+        choice_idx = choices.index(choice) if choice in choices else None
+        tier_code = next((VoteStore.TIER_CODES[code] for code, label in TIER_LABELS.items() if label == tier), None)
+        if choice_idx is None and tier_code is None:
+            view = list(range(len(users)))
+        elif tier_code is None:
+            view = [uid for uid, idx in enumerate(choice_of) if idx == choice_idx]
+        elif choice_idx is None:
+            view = [uid for uid, code in enumerate(tier_of) if code == tier_code]
+        else:
+            view = [uid for uid, (idx, code) in enumerate(zip(choice_of, tier_of)) if idx == choice_idx and code == tier_code]
+        if self.sort_column == 0:
+            view.sort(key=users.__getitem__, reverse=self.sort_reverse)
+        elif self.sort_column == 1:
+            view.sort(key=tier_of.__getitem__, reverse=self.sort_reverse)
+        elif self.sort_column == 2:
+            view.sort(key=lambda uid: choices[choice_of[uid]], reverse=self.sort_reverse)
+        elif self.sort_reverse:
+            view.reverse()
+        self.view = view
+        self.scroll_to(self.offset)
+
+    def sort_by(self, column):
+        self.sort_reverse = not self.sort_reverse if self.sort_column == column else False
+        self.sort_column = column
+        self.refresh_view()
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(offset, len(self.view) - self.height))
+        total = len(self.view)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.height) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.count_label.config(text=f"{total} / {len(self.users)}")
+        self.renderer.submit(self.name, None)
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.view)))
+        elif unit == "pages":
+            self.scroll_to(self.offset + int(amount) * self.height)
+        else:
+            self.scroll_to(self.offset + int(amount))
+
+    def on_mousewheel(self, event):
+        self.scroll_to(self.offset - (3 if event.delta > 0 else -3))
+
+    def build_visible_rows(self, _):
+        users, choice_of, tier_of, choices = self.users, self.choice_of, self.tier_of, self.choices
+        return [(uid + 1, users[uid], TIER_LABELS[VoteStore.TIERS[tier_of[uid]]], choices[choice_of[uid]])
+                for uid in self.view[self.offset:self.offset + self.height]]
+
+class App:
+    def __init__(self, root, integrated=False, metrics_port=None, metrics_summary_interval=60, record=None):
+        # integrated: the bot runs on the asyncio loop that also pumps Tk (see run_integrated)
+        # instead of on its own thread, so bot callbacks can touch widgets directly
+        self.integrated = integrated
+        self.metrics_port = metrics_port
+        self.metrics_summary_interval = metrics_summary_interval
+        self.record = record
+
+        client_id = os.getenv("TWITCH_CLIENT_ID") or "y8xpxp0qd5vrzx4yy7tnj71sxkokd1"
+        client_secret = os.getenv("TWITCH_CLIENT_SECRET") or "d96t22p7i41bjcrvli5mylw2rybpfq"
+        token_receiver_endpoint = (os.getenv("TWITCH_TOKEN_RECEIVER_ENDPOINT") or "https://twitch-token.kanonkc.com").rstrip("/")
+
+        if not client_id or not client_secret or not token_receiver_endpoint:
+            messagebox.showerror("Error", "หากคุณเป็นผู้ใช้งานผละเห็นข้อความนี้ โปรดติดต่อ KanonKC\nกรุณาตั้งค่า TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET และ TWITCH_TOKEN_RECEIVER_ENDPOINT ในไฟล์ .env")
+            root.destroy()
+            return
+
+        self.twitch_auth = AsyncTwitchAuth(
+            client_id=client_id,
+            client_secret=client_secret,
+            token_receiver_endpoint=token_receiver_endpoint
+        )
+        self.twitch_auth.add_listener(self.on_token_refreshed)
+
+        self.helix = TwitchAPI(
+            client_id=client_id,
+            client_secret=client_secret,
+            access_token=""
+        )
+
+        self.root = root
+        self.root.title("Twitch Vote and Queue Bot")
+        self.root.configure(bg="#2e2e2e")
+
+        style = ttk.Style()
+        style.theme_use('default')
+        style.configure("Treeview",
+                        background="#3c3f41",
+                        foreground="white",
+                        rowheight=25,
+                        fieldbackground="#3c3f41")
+        style.map('Treeview', background=[('selected', '#5a5a5a')])
+
+        self.renderer = TableRenderer(root)
+
+        # --- Top Frame (Input Form) ---
+        form_frame = tk.Frame(root, bg="#2e2e2e")
+        form_frame.pack(pady=10)
+
+        tk.Label(form_frame, text="Access Token:", fg="white", bg="#2e2e2e").grid(row=0, column=0, sticky="w")
+        self.token_entry = tk.Entry(form_frame, width=50, show='*')
+        self.token_entry.grid(row=0, column=1, padx=10, pady=5)
+
+        tk.Label(form_frame, text="Channel Name:", fg="white", bg="#2e2e2e").grid(row=1, column=0, sticky="w")
+        self.channel_entry = tk.Entry(form_frame, width=30)
+        self.channel_entry.grid(row=1, column=1, padx=10, pady=5)
+
+        tk.Label(form_frame, text="Vote Choices (comma separated):", fg="white", bg="#2e2e2e").grid(row=2, column=0, sticky="w")
+        self.choices_entry = tk.Entry(form_frame, width=30)
+        self.choices_entry.grid(row=2, column=1, padx=10, pady=5)
+
+        tk.Label(form_frame, text="Queue Keywords (comma separated):", fg="white", bg="#2e2e2e").grid(row=3, column=0, sticky="w")
+        self.queue_keywords_entry = tk.Entry(form_frame, width=30)
+        self.queue_keywords_entry.grid(row=3, column=1, padx=10, pady=5)
+
+        tk.Label(form_frame, text="Vote Time (seconds):", fg="white", bg="#2e2e2e").grid(row=4, column=0, sticky="w")
+        self.time_entry = tk.Entry(form_frame, width=10)
+        self.time_entry.grid(row=4, column=1, padx=10, pady=5, sticky="w")
+
+        tk.Label(form_frame, text="Match Mode:", fg="white", bg="#2e2e2e").grid(row=5, column=0, sticky="w")
+        self.match_mode = tk.StringVar(value=KeywordMatcher.EXACT)
+        self.match_mode_menu = tk.OptionMenu(form_frame, self.match_mode, *KeywordMatcher.MODES)
+        self.match_mode_menu.config(bg="#5a5a5a", fg="white", highlightthickness=0)
+        self.match_mode_menu.grid(row=5, column=1, padx=10, pady=5, sticky="w")
+
+        tk.Label(form_frame, text="Tier Weights (None,T1,T2,T3):", fg="white", bg="#2e2e2e").grid(row=6, column=0, sticky="w")
+        self.weights_entry = tk.Entry(form_frame, width=20)
+        self.weights_entry.insert(0, ",".join(str(weight) for weight in VoteTally.DEFAULT_WEIGHTS.values()))
+        self.weights_entry.grid(row=6, column=1, padx=10, pady=5, sticky="w")
+
+        tk.Label(form_frame, text="Export:", fg="white", bg="#2e2e2e").grid(row=7, column=0, sticky="w")
+        export_frame = tk.Frame(form_frame, bg="#2e2e2e")
+        export_frame.grid(row=7, column=1, padx=10, pady=5, sticky="w")
+        self.export_format = tk.StringVar(value="csv")
+        self.export_format_menu = tk.OptionMenu(export_frame, self.export_format, "csv", "jsonl")
+        self.export_format_menu.config(bg="#5a5a5a", fg="white", highlightthickness=0)
+        self.export_format_menu.pack(side="left")
+        self.export_gzip = tk.BooleanVar(value=False)
+        tk.Checkbutton(export_frame, text="gzip", variable=self.export_gzip,
+                       fg="white", bg="#2e2e2e", selectcolor="#3c3f41", activebackground="#2e2e2e", activeforeground="white").pack(side="left", padx=5)
+        self.export_expanded = tk.BooleanVar(value=False)
+        tk.Checkbutton(export_frame, text="Legacy .txt files", variable=self.export_expanded,
+                       fg="white", bg="#2e2e2e", selectcolor="#3c3f41", activebackground="#2e2e2e", activeforeground="white").pack(side="left", padx=5)
+    
+        self.countdown_label = tk.Label(root, text="Countdown: 0", font=("Arial", 16), fg="white", bg="#2e2e2e")
+        self.countdown_label.pack(pady=10)
+
+        self.standings_label = tk.Label(root, text="", font=("Arial", 12), fg="white", bg="#2e2e2e")
+        self.standings_label.pack()
+
+        # Errors and confirmations land here in integrated mode instead of in a modal dialog
+        self.status_label = tk.Label(root, text="", font=("Arial", 10), fg="white", bg="#2e2e2e")
+        self.status_label.pack()
+
+        # --- Button Frame ---
+        button_frame = tk.Frame(root, bg="#2e2e2e")
+        button_frame.pack(pady=10)
+
+        self.connect_button = tk.Button(button_frame, text="Connect Bot", command=self.connect_bot, bg="#5a5a5a", fg="white")
+        self.connect_button.grid(row=0, column=0, padx=5)
+        
+        self.login_twitch_button = tk.Button(button_frame, text="Login to Twitch", command=self.login_to_twitch, bg="#6441a5", fg="white")
+        self.login_twitch_button.grid(row=0, column=1, padx=5)
+
+        self.start_button = tk.Button(button_frame, text="Start Vote", command=self.start_vote, state=tk.DISABLED, bg="#5a5a5a", fg="white")
+        self.start_button.grid(row=0, column=2, padx=5)
+
+        self.set_queue_button = tk.Button(button_frame, text="Set Queue Keywords", command=self.set_queue_keywords, state=tk.DISABLED, bg="#5a5a5a", fg="white")
+        self.set_queue_button.grid(row=0, column=3, padx=5)
+
+        self.stop_button = tk.Button(button_frame, text="Stop Vote", command=self.stop_vote, state=tk.DISABLED, bg="#5a5a5a", fg="white")
+        self.stop_button.grid(row=0, column=4, padx=5)
+
+        self.profile_button = tk.Button(button_frame, text="Start Profiling", command=self.toggle_profiling, state=tk.DISABLED, bg="#5a5a5a", fg="white")
+        self.profile_button.grid(row=0, column=5, padx=5)
+
+        # --- Vote Result Table ---
+        tk.Label(root, text="Vote Results", font=("Arial", 14), fg="white", bg="#2e2e2e").pack(pady=(20, 5))
+        self.result_view = VirtualTable(root, self.renderer, "results")
+        self.result_view.pack(pady=5)
+
+        # --- Queue Section ---
+        tk.Label(root, text="Queue List", font=("Arial", 14), fg="white", bg="#2e2e2e").pack(pady=(20, 5))
+        self.queue_table = ttk.Treeview(root, columns=("No", "Username"), show="headings", height=10)
+        self.queue_table.heading("No", text="No.")
+        self.queue_table.heading("Username", text="Username")
+        self.queue_table.column("No", width=50, anchor="center")
+        self.queue_table.column("Username", width=150)
+        self.queue_table.pack(pady=5)
+
+        queue_button_frame = tk.Frame(root, bg="#2e2e2e")
+        queue_button_frame.pack(pady=10)
+
+        self.remove_button = tk.Button(queue_button_frame, text="Remove from Queue", command=self.remove_selected_from_queue, bg="#5a5a5a", fg="white")
+        self.remove_button.grid(row=0, column=0, padx=5)
+
+        self.clear_queue_button = tk.Button(queue_button_frame, text="Clear Queue", command=self.clear_queue, bg="#5a5a5a", fg="white")
+        self.clear_queue_button.grid(row=0, column=1, padx=5)
+
+        self.queue_priority = tk.BooleanVar(value=False)
+        self.queue_priority_check = tk.Checkbutton(queue_button_frame, text="Subscribers First", variable=self.queue_priority, command=self.set_queue_priority,
+                                                   fg="white", bg="#2e2e2e", selectcolor="#3c3f41", activebackground="#2e2e2e", activeforeground="white")
+        self.queue_priority_check.grid(row=0, column=2, padx=5)
+
+        self.renderer.register("queue", self.queue_table, self.build_queue_rows, read=self.read_queue)
+
+        # --- Draw Section ---
+        draw_frame = tk.Frame(root, bg="#2e2e2e")
+        draw_frame.pack(pady=10)
+
+        tk.Label(draw_frame, text="Draw from:", fg="white", bg="#2e2e2e").grid(row=0, column=0, sticky="w")
+        self.draw_pool = tk.StringVar(value="QUEUE")
+        self.draw_pool_menu = ttk.Combobox(draw_frame, textvariable=self.draw_pool, values=["QUEUE"], width=12, postcommand=self.update_draw_pools)
+        self.draw_pool_menu.grid(row=0, column=1, padx=5)
+        tk.Label(draw_frame, text="Winners:", fg="white", bg="#2e2e2e").grid(row=0, column=2, sticky="w")
+        self.draw_count_entry = tk.Entry(draw_frame, width=5)
+        self.draw_count_entry.insert(0, "1")
+        self.draw_count_entry.grid(row=0, column=3, padx=5)
+        tk.Label(draw_frame, text="Seed:", fg="white", bg="#2e2e2e").grid(row=0, column=4, sticky="w")
+        self.draw_seed_entry = tk.Entry(draw_frame, width=10)
+        self.draw_seed_entry.grid(row=0, column=5, padx=5)
+        self.draw_replace = tk.BooleanVar(value=False)
+        tk.Checkbutton(draw_frame, text="Allow repeats", variable=self.draw_replace,
+                       fg="white", bg="#2e2e2e", selectcolor="#3c3f41", activebackground="#2e2e2e", activeforeground="white").grid(row=0, column=6, padx=5)
+        self.draw_button = tk.Button(draw_frame, text="Draw Winners", command=self.draw_winners, bg="#5a5a5a", fg="white")
+        self.draw_button.grid(row=0, column=7, padx=5)
+
+        self.bot = None
+
+    def connect_bot(self):
+        token = self.token_entry.get()
+        channel = self.channel_entry.get()
+
+        if not token or not channel:
+            self.show_message("Error", "Please enter the access token and channel name.", error=True)
+            return
+
+        self.setup_twitch_bot(token, channel)
+
+    def setup_twitch_bot(self, token, channel):
+        self.helix.set_access_token(token)
+        self.bot = TwitchVoteBot(
+            token=token,
+            channel=channel,
+            vote_choices=[],
+            queue_keywords=[],
+            duration=0,
+            root=None if self.integrated else self.root,
+            update_countdown_callback=self.update_countdown,
+            finish_vote_callback=self.finish_vote,
+            update_queue_callback=self.update_queue,
+            twitch_api=AsyncTwitchAPI(
+                client_id=self.helix.client_id,
+                client_secret=self.helix.client_secret,
+                access_token=token
+            ),
+            metrics_port=self.metrics_port,
+            metrics_summary_interval=self.metrics_summary_interval
+        )
+        self.bot.queue_priority = self.queue_priority.get()
+        self.bot.profile_callback = self.update_profile_button
+        if self.record:
+            from chat_capture import ChatRecorder
+            self.bot.recorder = ChatRecorder(self.record)
+        self.update_queue(self.bot.queue_list)
+        if self.integrated:
+            self.bot.run_task = asyncio.get_running_loop().create_task(self.bot.start())
+        else:
+            self.bot.run_task = threading.Thread(target=self.run_bot)
+            self.bot.run_task.start()
+
+        # Enable buttons after the bot connects
+        self.connect_button.config(state=tk.DISABLED)
+        self.login_twitch_button.config(state=tk.DISABLED)
+        self.start_button.config(state=tk.NORMAL)
+        self.set_queue_button.config(state=tk.NORMAL)
+        self.stop_button.config(state=tk.NORMAL)
+        self.profile_button.config(state=tk.NORMAL)
+
+        # ส่งข้อความเชื่อมต่อบอท
+        self.bot.send_twitch_message("🔐 คอมพี่มาสถูกล็อคเเล้ว กรุณาติดต่อเพื่อปลดล็อค!")
+
+    def login_to_twitch(self):
+        # The browser flow can take minutes, so it runs on the event loop (or a helper
+        # thread in threaded mode) and only comes back to Tk to set up the bot
+        self.login_twitch_button.config(state=tk.DISABLED)
+        if self.integrated:
+            asyncio.get_running_loop().create_task(self.login())
+        else:
+            threading.Thread(target=asyncio.run, args=(self.login(),), daemon=True).start()
+
+    async def login(self):
+        try:
+            # Try to load existing tokens
+            token = await self.twitch_auth.ensure_token()
+            if token:
+                print("✅ Using existing tokens")
+            else:
+                print("🔄 Requesting new tokens...")
+                login = self.twitch_auth.get_user_login_url()
+                state = login["state"]
+                webbrowser.open(login["url"])
+
+                # Wait for confirmation
+                token_data = await self.twitch_auth.poll_for_token_from_receiver(state)
+                token = token_data["access_token"]
+            response = await asyncio.to_thread(self.helix.get_user_by_token, token)
+            channel = response['data'][0]['login']
+            self.call_ui(self.finish_login, token, channel)
+        except Exception as e:
+            print(f"❌ Login to Twitch failed: {str(e)}")
+            self.call_ui(self.login_twitch_button.config, state=tk.NORMAL)
+        finally:
+            if not self.integrated:
+                # This loop ends with the thread; the session is reopened on the bot's loop
+                await self.twitch_auth.close()
+
+    def finish_login(self, token, channel):
+        self.setup_twitch_bot(token, channel)
+        if self.integrated:
+            self.twitch_auth.start()
+        else:
+            self.bot.loop.call_soon_threadsafe(self.twitch_auth.start)
+        print("✅ Login successful!")
+
+    def on_token_refreshed(self, token):
+        # Runs on the bot's loop; new Helix requests and IRC reconnects pick up the new token
+        self.helix.set_access_token(token)
+        if self.bot:
+            self.bot.helix.set_access_token(token)
+            if hasattr(self.bot, "_connection"):
+                self.bot._connection._token = token
+
+    def call_ui(self, callback, *args, **kwargs):
+        if self.integrated:
+            callback(*args, **kwargs)
+        else:
+            self.root.after(0, lambda: callback(*args, **kwargs))
+
+    def show_message(self, title, text, error=False, window=False):
+        # messagebox runs a nested Tk loop; in integrated mode that loop is the bot's too and
+        # chat, votes and the countdown would stop until the dialog is closed
+        if not self.integrated:
+            if error:
+                messagebox.showerror(title, text)
+            else:
+                messagebox.showinfo(title, text)
+        elif window:
+            # A plain Toplevel has no loop of its own and is pumped with the rest of Tk
+            popup = tk.Toplevel(self.root, bg="#2e2e2e")
+            popup.title(title)
+            tk.Label(popup, text=text, fg="white", bg="#2e2e2e", justify="left").pack(padx=20, pady=10)
+            tk.Button(popup, text="OK", command=popup.destroy, bg="#5a5a5a", fg="white").pack(pady=(0, 10))
+        else:
+            self.status_label.config(text=f"{title}: {text}", fg="#ff6b6b" if error else "white")
+
+    def run_bot(self):
+        asyncio.run(self.bot.run())
+
+    def start_vote(self):
+        vote_choices = [c.strip().upper() for c in self.choices_entry.get().split(',') if c.strip()]
+        queue_keywords = [k.strip().upper() for k in self.queue_keywords_entry.get().split(',') if k.strip()]
+        try:
+            duration = int(self.time_entry.get())
+        except ValueError:
+            self.show_message("Error", "Vote time must be an integer.", error=True)
+            return
+        try:
+            weights = [int(w) for w in self.weights_entry.get().split(',')]
+            if len(weights) != len(VoteTally.DEFAULT_WEIGHTS):
+                raise ValueError
+        except ValueError:
+            self.show_message("Error", "Tier weights must be 4 integers: None,T1,T2,T3.", error=True)
+            return
+        self.bot.tally.tier_weights = dict(zip(VoteTally.DEFAULT_WEIGHTS, weights))
+        self.bot.export_format = self.export_format.get()
+        self.bot.export_gzip = self.export_gzip.get()
+        self.bot.export_expanded = self.export_expanded.get()
+
+        # Reset vote results table when starting new vote
+        self.result_view.clear()
+
+        self.bot.match_mode = self.match_mode.get()
+        self.bot.vote_choices = vote_choices
+        self.bot.queue_keywords = queue_keywords
+        self.bot.duration = duration
+        self.bot.start_countdown()
+
+        # ส่งข้อความเริ่มโหวต
+        self.bot.send_twitch_message(f"🚨 เริ่มโหวตแล้ว! พิมพ์ {', '.join(self.bot.vote_choices)} เพื่อเลือก มีเวลา {self.bot.duration} วินาที!")
+
+    def set_queue_keywords(self):
+        queue_keywords = [k.strip().upper() for k in self.queue_keywords_entry.get().split(',') if k.strip()]
+        self.bot.match_mode = self.match_mode.get()
+        self.bot.queue_keywords = queue_keywords
+        self.show_message("Success", "Queue keywords have been set.")
+
+    def stop_vote(self):
+        if self.bot and (self.bot.vote_running or self.bot.vote_restored):
+            self.bot.stop_vote()  # Call stop_vote from bot class to stop voting
+
+    def toggle_profiling(self):
+        # Profiles the bot's loop for up to 60 seconds, or stops the running profile
+        if self.bot:
+            self.bot.loop.call_soon_threadsafe(self.bot.profiler.toggle, 60)
+
+    def update_profile_button(self, running):
+        self.profile_button.config(text="Stop Profiling" if running else "Start Profiling")
+
+    def update_countdown(self, time_left):
+        self.countdown_label.config(text=f"Countdown: {time_left}")
+        if self.bot:
+            self.standings_label.config(text=self.bot.tally.format_standings(limit=10))
+
+    def finish_vote(self, votes):
+        # votes is VoteStore.columns(); rows are built only for what is on screen
+        self.result_view.set_votes(*votes)
+
+    def update_queue(self, queue_list):
+        # Called for every join, so only mark the table; read_queue copies it once per frame
+        self.renderer.mark("queue")
+
+    def read_queue(self):
+        if self.bot is None:
+            return []
+        if self.integrated:
+            return list(self.bot.queue_list)
+        # In threaded mode the queue belongs to the bot thread, so it is copied there
+        queue_list = self.bot.queue_list
+        self.bot.loop.call_soon_threadsafe(lambda: self.renderer.submit("queue", list(queue_list)))
+        return None
+
+    def build_queue_rows(self, queue_list):
+        return [(idx, user) for idx, user in enumerate(queue_list, start=1)]
+
+    def remove_selected_from_queue(self):
+        selected_items = self.queue_table.selection()
+        users = [self.queue_table.item(item, "values")[1] for item in selected_items]
+        self.bot.remove_from_queue(users)
+        self.update_queue(self.bot.queue_list)
+
+    def update_draw_pools(self):
+        choices = list(self.bot.votes.choices) if self.bot else []
+        self.draw_pool_menu.config(values=["QUEUE", *choices])
+
+    def draw_winners(self):
+        if not self.bot:
+            return
+        try:
+            count = int(self.draw_count_entry.get())
+            seed = int(self.draw_seed_entry.get()) if self.draw_seed_entry.get().strip() else None
+        except ValueError:
+            self.show_message("Error", "Winners and seed must be integers.", error=True)
+            return
+        try:
+            winners, seed = self.bot.draw_winners(self.draw_pool.get().strip().upper(), count, self.draw_replace.get(), seed)
+        except ValueError as e:
+            self.show_message("Error", str(e), error=True)
+            return
+        self.show_message("Winners", "\n".join(winners) + f"\n\nseed: {seed}", window=True)
+
+    def set_queue_priority(self):
+        if self.bot:
+            self.bot.queue_priority = self.queue_priority.get()
+
+    def clear_queue(self):
+        self.bot.clear_queue()
+        self.update_queue(self.bot.queue_list)
+
+async def run_integrated(fps=60, **options):
+    # Tk is pumped from the bot's event loop at a fixed cadence instead of running mainloop(),
+    # so widgets, votes and the queue are only ever touched from this one thread. Nothing may
+    # run a nested Tk loop here (messagebox, wait_window), see App.show_message.
+    root = tk.Tk()
+    app = App(root, integrated=True, **options)
+    closed = asyncio.Event()
+    try:
+        root.protocol("WM_DELETE_WINDOW", closed.set)
+    except tk.TclError:
+        return  # App closed the window during setup
+    loop = asyncio.get_running_loop()
+    interval = 1 / fps
+    next_frame = loop.time()
+    while not closed.is_set():
+        try:
+            root.update()
+        except tk.TclError:
+            break
+        next_frame = max(next_frame + interval, loop.time())
+        await asyncio.sleep(next_frame - loop.time())
+    if app.bot:
+        await app.bot.close()
+    await app.twitch_auth.close()
+    try:
+        root.destroy()
+    except tk.TclError:
+        pass
+
+def run_gui(integrated=True, **options):
+    if integrated:
+        asyncio.run(run_integrated(**options))
+        return
+    root = tk.Tk()
+    app = App(root, **options)
+    root.mainloop()
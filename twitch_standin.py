@@ -0,0 +1,475 @@
+# Local stand-in for the parts of Twitch the bot talks to: Helix users and subscriptions,
+# the OAuth validate/token/authorize endpoints, the token receiver and IRC over websocket.
+# Latency, 429s, page size and disconnects can be injected, so subscriber crawls, login
+# polling and reconnects can be exercised and benchmarked without touching live Twitch.
+#
+#   python twitch_standin.py --subscribers 50000 --page-size 20 --latency 80 --jitter 40 --ratelimit 800
+#   python twitch_standin.py --chat-rate 500 --disconnect-every 30 --throttle-rate 0.05
+#
+# then start the bot with the endpoints it prints (or put them in .env).
+import argparse
+import asyncio
+import base64
+import json
+import random
+import secrets
+import time
+import zlib
+
+from aiohttp import web, WSMsgType
+
+CHATTER = ("lol", "PogChamp", "KEKW", "gg", "hello chat", "what is this vote about?", "LUL LUL LUL", "first time here")
+
+def viewer_login(idx):
+    # Same naming as bench_chat_load.py, so captures and benchmarks line up
+    return f"viewer_{idx:07d}"
+
+def user_id_for(login):
+    if login.startswith("viewer_") and login[7:].isdigit():
+        return str(10_000_000 + int(login[7:]))
+    return str(100_000_000 + zlib.crc32(login.lower().encode()) % 900_000_000)
+
+def tier_for(idx):
+    return ("3000", "2000", "2000")[idx % 10] if idx % 10 < 3 else "1000"
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["o"])
+    except Exception:
+        raise ValueError(f"Bad cursor: {cursor}")
+
+class TokenBucket:
+    # Helix style points bucket: refills continuously, Ratelimit-Reset is when it is full again
+    def __init__(self, limit, period=60):
+        self.limit = limit
+        self.rate = limit / period
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def headers(self):
+        return {
+            "Ratelimit-Limit": str(self.limit),
+            "Ratelimit-Remaining": str(int(self.tokens)),
+            "Ratelimit-Reset": str(int(time.time() + (self.limit - self.tokens) / self.rate) + 1)
+        }
+
+class IrcConnection:
+    def __init__(self, ws, transport):
+        self.ws = ws
+        self.transport = transport
+        self.nick = None
+        self.token = None
+        self.channels = set()
+
+    async def send(self, *lines):
+        await self.ws.send_str("".join(line + "\r\n" for line in lines))
+
+class TwitchStandin:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.client_id = args.client_id
+        self.tokens = {}  # access token -> (login, expires_at)
+        self.refresh_tokens = {}  # refresh token -> login
+        self.codes = {}  # authorization code -> login
+        self.receiver = {}  # state -> (ready_at, token data)
+        self.buckets = {}
+        self.connections = set()
+        self.choices = [choice.strip().upper() for choice in args.choices.split(",") if choice.strip()]
+        self.stats = {"requests": {}, "throttled": 0, "dropped": 0, "irc_connects": 0, "irc_disconnects": 0,
+                      "chat_out": 0, "chat_in": 0}
+        self.app = web.Application(middlewares=[self.inject])
+        self.app.add_routes([
+            web.get("/helix/users", self.users),
+            web.get("/helix/subscriptions", self.subscriptions),
+            web.get("/oauth2/validate", self.validate),
+            web.post("/oauth2/token", self.token),
+            web.get("/oauth2/authorize", self.authorize),
+            web.get("/callback", self.callback),
+            web.get("/token/{state}", self.receive_token),
+            web.get("/irc", self.irc),
+            web.get("/standin/stats", self.report)
+        ])
+
+    # --- Injection ---
+
+    @web.middleware
+    async def inject(self, request, handler):
+        path = request.path
+        if path in ("/irc", "/standin/stats"):
+            return await handler(request)
+        key = path.split("/")[-1] if not path.startswith("/token/") else "receiver"
+        self.stats["requests"][key] = self.stats["requests"].get(key, 0) + 1
+        delay = self.args.latency + self.rng.uniform(-self.args.jitter, self.args.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self.args.drop_rate and self.rng.random() < self.args.drop_rate:
+            self.stats["dropped"] += 1
+            request.transport.close()
+            raise web.HTTPServiceUnavailable()
+        if not path.startswith("/helix/"):
+            return await handler(request)
+
+        bucket = None
+        if self.args.ratelimit:
+            key = request.headers.get("Authorization", "")
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.args.ratelimit)
+        if (bucket is not None and not bucket.take()) or (self.args.throttle_rate and self.rng.random() < self.args.throttle_rate):
+            self.stats["throttled"] += 1
+            body = {"error": "Too Many Requests", "status": 429, "message": "Too Many Requests"}
+            headers = bucket.headers() if bucket else {"Ratelimit-Limit": "800", "Ratelimit-Remaining": "0", "Ratelimit-Reset": str(int(time.time()) + 1)}
+            return web.json_response(body, status=429, headers=headers)
+        response = await handler(request)
+        if bucket is not None:
+            response.headers.update(bucket.headers())
+        return response
+
+    def unauthorized(self):
+        return web.json_response({"status": 401, "message": "invalid access token"}, status=401)
+
+    def token_owner(self, request):
+        # Unknown tokens belong to --login unless --strict-tokens; issued ones expire
+        header = request.headers.get("Authorization", "")
+        token = header.split(" ", 1)[1] if " " in header else ""
+        entry = self.tokens.get(token)
+        if entry is None:
+            return None if self.args.strict_tokens or not token else (self.args.login, None)
+        if entry[1] < time.time():
+            return None
+        return entry
+
+    # --- Helix ---
+
+    def user_data(self, login):
+        return {
+            "id": user_id_for(login),
+            "login": login.lower(),
+            "display_name": login,
+            "type": "",
+            "broadcaster_type": "partner" if login.lower() == self.args.login else "",
+            "description": "",
+            "profile_image_url": "",
+            "offline_image_url": "",
+            "view_count": 0,
+            "created_at": "2016-12-14T20:32:28Z"
+        }
+
+    async def users(self, request):
+        owner = self.token_owner(request)
+        if owner is None:
+            return self.unauthorized()
+        logins = request.query.getall("login", [])
+        ids = request.query.getall("id", [])
+        if not logins and not ids:
+            logins = [owner[0]]
+        data = [self.user_data(login) for login in logins]
+        for user_id in ids:
+            if user_id.isdigit() and 10_000_000 <= int(user_id) < 10_000_000 + self.args.chat_users:
+                data.append(self.user_data(viewer_login(int(user_id) - 10_000_000)))
+        return web.json_response({"data": data})
+
+    def subscription(self, broadcaster, idx):
+        login = viewer_login(idx)
+        return {
+            "broadcaster_id": user_id_for(broadcaster),
+            "broadcaster_login": broadcaster,
+            "broadcaster_name": broadcaster,
+            "gifter_id": "",
+            "gifter_login": "",
+            "gifter_name": "",
+            "is_gift": False,
+            "plan_name": "Channel Subscription",
+            "tier": tier_for(idx),
+            "user_id": user_id_for(login),
+            "user_name": login,
+            "user_login": login
+        }
+
+    async def subscriptions(self, request):
+        owner = self.token_owner(request)
+        if owner is None:
+            return self.unauthorized()
+        if "broadcaster_id" not in request.query:
+            return web.json_response({"error": "Bad Request", "status": 400, "message": "Missing required parameter \"broadcaster_id\""}, status=400)
+        broadcaster = owner[0]
+        total = self.args.subscribers
+        user_ids = request.query.getall("user_id", [])
+        if user_ids:
+            data = []
+            for user_id in user_ids[:100]:
+                idx = int(user_id) - 10_000_000 if user_id.isdigit() else -1
+                if 0 <= idx < total:
+                    data.append(self.subscription(broadcaster, idx))
+            return web.json_response({"data": data, "pagination": {}, "total": total, "points": total})
+        try:
+            first = min(int(request.query.get("first", 20)), 100, self.args.page_size)
+            offset = decode_cursor(request.query["after"]) if "after" in request.query else 0
+        except ValueError as e:
+            return web.json_response({"error": "Bad Request", "status": 400, "message": str(e)}, status=400)
+        end = min(offset + first, total)
+        data = [self.subscription(broadcaster, idx) for idx in range(offset, end)]
+        pagination = {"cursor": encode_cursor(end)} if end < total else {}
+        return web.json_response({"data": data, "pagination": pagination, "total": total, "points": total})
+
+    # --- OAuth and token receiver ---
+
+    def issue_token(self, login):
+        access_token = secrets.token_hex(15)
+        refresh_token = secrets.token_hex(25)
+        self.tokens[access_token] = (login, time.time() + self.args.token_ttl)
+        self.refresh_tokens[refresh_token] = login
+        return {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "expires_in": self.args.token_ttl,
+            "scope": ["channel:read:subscriptions", "chat:read", "chat:edit"],
+            "token_type": "bearer"
+        }
+
+    async def validate(self, request):
+        owner = self.token_owner(request)
+        if owner is None:
+            return self.unauthorized()
+        login, expires_at = owner
+        return web.json_response({
+            "client_id": self.client_id,
+            "login": login,
+            "scopes": ["channel:read:subscriptions", "chat:read", "chat:edit"],
+            "user_id": user_id_for(login),
+            "expires_in": int(expires_at - time.time()) if expires_at else 0
+        })
+
+    async def token(self, request):
+        form = await request.post()
+        grant_type = form.get("grant_type")
+        if grant_type == "refresh_token":
+            login = self.refresh_tokens.pop(form.get("refresh_token"), None)
+            if login is None and self.args.strict_tokens:
+                return web.json_response({"status": 400, "message": "Invalid refresh token"}, status=400)
+            return web.json_response(self.issue_token(login or self.args.login))
+        if grant_type == "authorization_code":
+            login = self.codes.pop(form.get("code"), None)
+            if login is None:
+                return web.json_response({"status": 400, "message": "Invalid authorization code"}, status=400)
+            return web.json_response(self.issue_token(login))
+        return web.json_response({"status": 400, "message": "Invalid grant type"}, status=400)
+
+    async def authorize(self, request):
+        # Stands in for the user clicking Authorize: straight back to the redirect URI with a code
+        code = secrets.token_hex(15)
+        self.codes[code] = self.args.login
+        redirect_uri = request.query.get("redirect_uri", "/callback")
+        raise web.HTTPFound(f"{redirect_uri}?code={code}&state={request.query.get('state', '')}")
+
+    async def callback(self, request):
+        login = self.codes.pop(request.query.get("code"), None)
+        state = request.query.get("state")
+        if login is None or not state:
+            return web.Response(status=400, text="Invalid authorization code")
+        self.receiver[state] = (time.monotonic() + self.args.login_delay, self.issue_token(login))
+        return web.Response(text="Logged in, you can close this window.")
+
+    async def receive_token(self, request):
+        entry = self.receiver.get(request.match_info["state"])
+        if entry is None or entry[0] > time.monotonic():
+            return web.json_response({"message": "Token not ready"}, status=404)
+        del self.receiver[request.match_info["state"]]
+        return web.json_response(entry[1])
+
+    # --- IRC ---
+
+    async def irc(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        connection = IrcConnection(ws, request.transport)
+        self.connections.add(connection)
+        self.stats["irc_connects"] += 1
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    break
+                for line in msg.data.split("\r\n"):
+                    if line:
+                        await self.handle_irc(connection, line)
+        finally:
+            self.connections.discard(connection)
+        return ws
+
+    async def handle_irc(self, connection, line):
+        command, _, rest = line.partition(" ")
+        command = command.upper()
+        if command == "PASS":
+            connection.token = rest.split(":", 1)[-1]
+        elif command == "NICK":
+            if self.args.strict_tokens and connection.token not in self.tokens:
+                await connection.send(":tmi.twitch.tv NOTICE * :Login authentication failed")
+                await connection.ws.close()
+                return
+            nick = connection.nick = rest.strip().lower()
+            await connection.send(
+                f":tmi.twitch.tv 001 {nick} :Welcome, GLHF!",
+                f":tmi.twitch.tv 002 {nick} :Your host is tmi.twitch.tv",
+                f":tmi.twitch.tv 003 {nick} :This server is rather new",
+                f":tmi.twitch.tv 004 {nick} :-",
+                f":tmi.twitch.tv 375 {nick} :-",
+                f":tmi.twitch.tv 372 {nick} :You are in a maze of twisty passages, all alike.",
+                f":tmi.twitch.tv 376 {nick} :>"
+            )
+        elif command == "CAP":
+            caps = rest.split(":", 1)[-1]
+            await connection.send(f":tmi.twitch.tv CAP * ACK :{caps}")
+        elif command == "JOIN":
+            nick = connection.nick
+            for channel in rest.strip().split(","):
+                name = channel.lstrip("#").lower()
+                connection.channels.add(name)
+                await connection.send(
+                    f":{nick}!{nick}@{nick}.tmi.twitch.tv JOIN #{name}",
+                    f":{nick}.tmi.twitch.tv 353 {nick} = #{name} :{nick}",
+                    f":{nick}.tmi.twitch.tv 366 {nick} #{name} :End of /NAMES list",
+                    f"@badge-info=;badges=broadcaster/1;color=;display-name={nick};emote-sets=0;mod=0;subscriber=0;user-type= :tmi.twitch.tv USERSTATE #{name}",
+                    f"@emote-only=0;followers-only=-1;r9k=0;room-id={user_id_for(name)};slow=0;subs-only=0 :tmi.twitch.tv ROOMSTATE #{name}"
+                )
+        elif command == "PART":
+            for channel in rest.strip().split(","):
+                connection.channels.discard(channel.lstrip("#").lower())
+        elif command == "PING":
+            await connection.send(f":tmi.twitch.tv PONG tmi.twitch.tv {rest}")
+        elif command == "PRIVMSG":
+            self.stats["chat_in"] += 1
+
+    def chat_line(self, channel):
+        idx = self.rng.randrange(self.args.chat_users)
+        login = viewer_login(idx)
+        badges = badge_info = ""
+        if idx < self.args.subscribers:
+            months = idx % 24 + 1
+            badges = f"subscriber/{(int(tier_for(idx)) if tier_for(idx) != '1000' else 0) + months}"
+            badge_info = f"subscriber/{months}"
+        roll = self.rng.random()
+        if roll < self.args.spam_ratio:
+            content = self.rng.choice(CHATTER)
+        elif roll < self.args.spam_ratio + self.args.queue_ratio:
+            content = self.args.queue_keyword.lower()
+        else:
+            content = self.rng.choice(self.choices).lower()
+        tags = (f"@badge-info={badge_info};badges={badges};color=;display-name={login};emotes=;first-msg=0;flags=;"
+                f"id={secrets.token_hex(16)};mod=0;returning-chatter=0;room-id={user_id_for(channel)};"
+                f"subscriber={1 if badges else 0};tmi-sent-ts={int(time.time() * 1000)};turbo=0;"
+                f"user-id={user_id_for(login)};user-type=")
+        return f"{tags} :{login}!{login}@{login}.tmi.twitch.tv PRIVMSG #{channel} :{content}"
+
+    async def generate_chat(self):
+        # --chat-rate messages per second into every joined channel, sent in small batches
+        tick = 0.05
+        carry = 0.0
+        while True:
+            await asyncio.sleep(tick)
+            carry += self.args.chat_rate * tick
+            count, carry = int(carry), carry - int(carry)
+            if not count:
+                continue
+            for connection in list(self.connections):
+                for channel in connection.channels:
+                    try:
+                        await connection.send(*(self.chat_line(channel) for _ in range(count)))
+                    except ConnectionResetError:
+                        break
+                    self.stats["chat_out"] += count
+
+    async def disconnect_chat(self):
+        while True:
+            await asyncio.sleep(self.args.disconnect_every * self.rng.uniform(0.5, 1.5))
+            for connection in list(self.connections):
+                self.stats["irc_disconnects"] += 1
+                if self.args.disconnect_notice:
+                    await connection.send(":tmi.twitch.tv RECONNECT")
+                # A dropped socket rather than a close handshake, like a network failure
+                connection.transport.close()
+
+    # --- Reporting ---
+
+    async def report(self, request):
+        return web.json_response(self.stats)
+
+    async def print_stats(self):
+        while True:
+            await asyncio.sleep(self.args.report_interval)
+            requests = ", ".join(f"{name} {count}" for name, count in sorted(self.stats["requests"].items()))
+            print(f"📊 {requests or 'no requests'} | 429s {self.stats['throttled']} | dropped {self.stats['dropped']}"
+                  f" | irc {len(self.connections)} up, {self.stats['irc_connects']} connects, {self.stats['irc_disconnects']} kicked"
+                  f" | chat out {self.stats['chat_out']} in {self.stats['chat_in']}")
+
+    async def run(self):
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        await web.TCPSite(runner, self.args.host, self.args.port).start()
+        base = f"http://{self.args.host}:{self.args.port}"
+        print(f"🧪 Twitch stand-in on {base}")
+        print(f"TWITCH_API_ENDPOINT={base}/helix")
+        print(f"TWITCH_AUTH_ENDPOINT={base}/oauth2")
+        print(f"TWITCH_IRC_ENDPOINT=ws://{self.args.host}:{self.args.port}/irc")
+        print(f"TWITCH_TOKEN_RECEIVER_ENDPOINT={base}")
+        tasks = []
+        if self.args.chat_rate:
+            tasks.append(asyncio.create_task(self.generate_chat()))
+        if self.args.disconnect_every:
+            tasks.append(asyncio.create_task(self.disconnect_chat()))
+        if self.args.report_interval:
+            tasks.append(asyncio.create_task(self.print_stats()))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for Helix, Twitch OAuth and Twitch chat")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--login", default="standin", help="broadcaster that logs in and owns unknown tokens")
+    parser.add_argument("--client-id", default="standin")
+    parser.add_argument("--strict-tokens", action="store_true", help="only accept tokens this server issued")
+    parser.add_argument("--token-ttl", type=int, default=14400, help="seconds until issued access tokens expire")
+    parser.add_argument("--login-delay", type=float, default=0, help="seconds before the receiver hands out a token")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=100, help="cap on subscriptions per page, lower for deeper pagination")
+    parser.add_argument("--latency", type=float, default=0, help="added HTTP latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="random +/- ms on top of --latency")
+    parser.add_argument("--ratelimit", type=int, default=800, help="Helix points per minute per token, 0 for unlimited")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="share of Helix requests answered with 429 regardless")
+    parser.add_argument("--drop-rate", type=float, default=0, help="share of HTTP requests whose connection is dropped")
+    parser.add_argument("--chat-rate", type=float, default=0, help="generated chat messages per second per joined channel")
+    parser.add_argument("--chat-users", type=int, default=20_000)
+    parser.add_argument("--choices", default="A,B,C,D")
+    parser.add_argument("--spam-ratio", type=float, default=0.3)
+    parser.add_argument("--queue-ratio", type=float, default=0.05)
+    parser.add_argument("--queue-keyword", default="JOIN")
+    parser.add_argument("--disconnect-every", type=float, default=0, help="mean seconds between dropping every chat connection")
+    parser.add_argument("--disconnect-notice", action="store_true", help="send RECONNECT before dropping, like Twitch maintenance")
+    parser.add_argument("--report-interval", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    args.login = args.login.lower()
+    try:
+        asyncio.run(TwitchStandin(args).run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()